@@ -2,10 +2,37 @@ from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from sqlalchemy import func
 from app.extensions import db
-from app.models import Document, Category, AcademicPeriod, Tag, AuditLog, AdminUser
+from app.models import (
+    Document,
+    Category,
+    AcademicPeriod,
+    Tag,
+    AuditLog,
+    AdminUser,
+    document_tag,
+)
+from app.search.outbox import queue_index_sync_ids
 from . import admin
 
 
+def _document_ids(condition):
+    # Ids only: Document rows would drag in content_text
+    return [doc_id for (doc_id,) in db.session.query(Document.id).filter(condition)]
+
+
+def _has_documents(condition):
+    return db.session.query(Document.id).filter(condition).first() is not None
+
+
+def _tagged_document_ids(tag_id):
+    return [
+        doc_id
+        for (doc_id,) in db.session.query(document_tag.c.document_id).filter(
+            document_tag.c.tag_id == tag_id
+        )
+    ]
+
+
 @admin.route("/")
 @login_required
 def dashboard():
@@ -87,11 +114,23 @@ def categories():
 @login_required
 def edit_category(id):
     category = Category.query.get_or_404(id)
+    old_name, old_parent_id = category.name, category.parent_id
     category.name = request.form.get("name", category.name)
     category.description = request.form.get("description", category.description)
     parent_id = request.form.get("parent_id")
-    category.parent_id = parent_id if parent_id else None
-
+    category.parent_id = int(parent_id) if parent_id else None
+
+    # Indexed documents carry the category name and, for it and every
+    # subcategory, the chain of parent ids
+    if category.parent_id != old_parent_id:
+        affected = [category]
+        for current in affected:
+            affected.extend(c for c in current.children if c not in affected)
+        queue_index_sync_ids(
+            _document_ids(Document.category_id.in_([c.id for c in affected]))
+        )
+    elif category.name != old_name:
+        queue_index_sync_ids(_document_ids(Document.category_id == category.id))
     db.session.commit()
     flash("Category updated.", "success")
     return redirect(url_for("admin.categories"))
@@ -101,7 +140,7 @@ def edit_category(id):
 @login_required
 def delete_category(id):
     category = Category.query.get_or_404(id)
-    if category.documents:
+    if _has_documents(Document.category_id == category.id):
         flash("Cannot delete category with documents.", "danger")
     else:
         db.session.delete(category)
@@ -154,7 +193,7 @@ def toggle_period(id):
 @login_required
 def delete_period(id):
     period = AcademicPeriod.query.get_or_404(id)
-    if period.documents:
+    if _has_documents(Document.academic_period_id == period.id):
         flash("Cannot delete period with documents.", "danger")
     else:
         db.session.delete(period)
@@ -189,8 +228,11 @@ def tags():
 @login_required
 def edit_tag(id):
     tag = Tag.query.get_or_404(id)
+    old_name = tag.name
     tag.name = request.form.get("name", tag.name)
     tag.color = request.form.get("color", tag.color)
+    if tag.name != old_name:
+        queue_index_sync_ids(_tagged_document_ids(tag.id))
     db.session.commit()
     flash("Tag updated.", "success")
     return redirect(url_for("admin.tags"))
@@ -200,6 +242,7 @@ def edit_tag(id):
 @login_required
 def delete_tag(id):
     tag = Tag.query.get_or_404(id)
+    queue_index_sync_ids(_tagged_document_ids(tag.id))
     db.session.delete(tag)
     db.session.commit()
     flash("Tag deleted.", "success")
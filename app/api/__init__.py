@@ -1,3 +1,12 @@
-from flask import Blueprint
+from flask import Blueprint, jsonify
+from flask_login import current_user
 
 api = Blueprint("api", __name__, url_prefix="/api")
+
+
+@api.before_request
+def require_login():
+    # Responses carry document text and snippets; a JSON 401 instead of the
+    # login redirect @login_required would give
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Authentication required"}), 401
@@ -0,0 +1,121 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from flask import Response, current_app, request, stream_with_context
+from sqlalchemy import and_, or_
+from app.extensions import db
+from app.models import Document
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+class CursorError(ValueError):
+    pass
+
+
+def page_size(default=50):
+    """
+    The requested page size, clamped to API_MAX_PAGE_SIZE.
+    """
+    per_page = request.args.get("per_page", default, type=int) or default
+    return max(1, min(per_page, current_app.config["API_MAX_PAGE_SIZE"]))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise CursorError("Invalid cursor")
+    if not isinstance(values, dict):
+        raise CursorError("Invalid cursor")
+    return values
+
+
+def document_cursor(document):
+    uploaded_at = document.uploaded_at.isoformat() if document.uploaded_at else None
+    return encode_cursor({"u": uploaded_at, "i": document.id})
+
+
+def _nulls_first():
+    # Where rows without uploaded_at fall in the descending (uploaded_at, id)
+    # index order: first on PostgreSQL, last on SQLite
+    return db.session.get_bind().dialect.name == "postgresql"
+
+
+def newest_first(query, cursor=None):
+    """
+    Orders documents newest first on (uploaded_at, id) and, given a cursor,
+    continues strictly after the document it points at.
+    """
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            uploaded_at = values["u"]
+            if uploaded_at is not None:
+                uploaded_at = datetime.fromisoformat(uploaded_at)
+            doc_id = int(values["i"])
+        except (KeyError, TypeError, ValueError):
+            raise CursorError("Invalid cursor")
+        if uploaded_at is None:
+            after = and_(Document.uploaded_at.is_(None), Document.id < doc_id)
+            if _nulls_first():
+                after = or_(after, Document.uploaded_at.isnot(None))
+        else:
+            after = or_(
+                Document.uploaded_at < uploaded_at,
+                and_(Document.uploaded_at == uploaded_at, Document.id < doc_id),
+            )
+            if not _nulls_first():
+                after = or_(after, Document.uploaded_at.is_(None))
+        query = query.filter(after)
+    return query.order_by(Document.uploaded_at.desc(), Document.id.desc())
+
+
+def keyset_page(query, cursor, limit):
+    """
+    Returns (documents, next_cursor). Fetches one extra row to know whether
+    another page exists, so no COUNT is needed.
+    """
+    documents = newest_first(query, cursor).limit(limit + 1).all()
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    return documents, document_cursor(documents[-1])
+
+
+def wants_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def ndjson_response(rows):
+    """
+    Streams an iterable of dicts as newline-delimited JSON.
+    """
+
+    def generate():
+        for row in rows:
+            yield json.dumps(row, separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def stream_documents(query, to_dict):
+    """
+    Yields every document of an ordered query, read through a server-side
+    cursor in API_STREAM_BATCH_SIZE chunks. Each row carries the cursor that
+    resumes after it.
+    """
+    batch_size = current_app.config["API_STREAM_BATCH_SIZE"]
+    for document in query.yield_per(batch_size):
+        row = to_dict(document)
+        row["cursor"] = document_cursor(document)
+        yield row
@@ -1,14 +1,60 @@
-from flask import request, jsonify
+from flask import current_app, request, jsonify
 from sqlalchemy import or_, func
+from sqlalchemy.orm import defer, selectinload
 from app.extensions import db
-from app.models import Document, Category, AcademicPeriod, Tag
+from app.models import Document, Category, AcademicPeriod, Tag, IngestJob
+from app.search.services import facet_counts
+from app.search.backends import (
+    filtered_documents,
+    filters_from_args,
+    highlight_document,
+    search as search_backend,
+    sort_from_args,
+)
+from app.search.suggest import suggest
+from app.api.pagination import (
+    CursorError,
+    decode_cursor,
+    encode_cursor,
+    keyset_page,
+    ndjson_response,
+    newest_first,
+    page_size,
+    stream_documents,
+    wants_ndjson,
+)
 from app.api import api
 
 
+def _listable(query):
+    # Rows are serialized with doc_to_dict: skip the extracted text, batch the tags
+    return query.options(defer(Document.content_text), selectinload(Document.tags))
+
+
+def _document_page(documents, key, **extra):
+    """
+    One keyset page of documents, or the whole result set as NDJSON.
+    """
+    cursor = request.args.get("cursor")
+    try:
+        if wants_ndjson():
+            ordered = newest_first(_listable(documents), cursor)
+            return ndjson_response(stream_documents(ordered, doc_to_dict))
+
+        per_page = page_size()
+        page, next_cursor = keyset_page(_listable(documents), cursor, per_page)
+    except CursorError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return {
+        key: [doc_to_dict(d) for d in page],
+        **extra,
+        "pagination": {"per_page": per_page, "next_cursor": next_cursor},
+    }
+
+
 @api.route("/documents", methods=["GET"])
 def list_documents():
-    page = request.args.get("page", 1, type=int)
-    per_page = request.args.get("per_page", 50, type=int)
     category_filter = request.args.get("category", type=int)
     period_filter = request.args.get("period", type=int)
     tag_filter = request.args.get("tag", type=int)
@@ -32,19 +78,7 @@ def list_documents():
             )
         )
 
-    pagination = query.order_by(Document.uploaded_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-
-    return {
-        "documents": [doc_to_dict(d) for d in pagination.items],
-        "pagination": {
-            "page": page,
-            "per_page": per_page,
-            "total": pagination.total,
-            "pages": pagination.pages,
-        },
-    }
+    return _document_page(query, "documents")
 
 
 @api.route("/documents/<int:doc_id>", methods=["GET"])
@@ -53,6 +87,33 @@ def get_document(doc_id):
     return jsonify(doc_to_dict(doc))
 
 
+@api.route("/documents/<int:doc_id>/highlight", methods=["GET"])
+def highlight_document_content(doc_id):
+    # Search results only carry cropped snippets; the full highlighted text
+    # is fetched here when a document is opened from a search
+    doc = Document.query.filter_by(id=doc_id, is_deleted=False).first_or_404()
+    query_str = request.args.get("q", "").strip()
+    return {"id": doc.id, "query": query_str, "content": highlight_document(doc, query_str)}
+
+
+@api.route("/documents/<int:doc_id>/status", methods=["GET"])
+def get_document_status(doc_id):
+    doc = Document.query.filter_by(id=doc_id, is_deleted=False).first_or_404()
+    job = (
+        IngestJob.query.filter_by(document_id=doc.id)
+        .order_by(IngestJob.id.desc())
+        .first()
+    )
+    return jsonify(
+        {
+            "id": doc.id,
+            "status": doc.status,
+            "error": doc.processing_error,
+            "job": job_to_dict(job) if job else None,
+        }
+    )
+
+
 @api.route("/categories", methods=["GET"])
 def list_categories():
     categories = (
@@ -102,41 +163,100 @@ def admin_stats():
     }
 
 
+def _search_hits(query_str, filters, limit, offset, sort="relevance"):
+    """
+    Runs a search and returns (result, rows), where rows pairs each hit's
+    position in the ranking with its serialized document.
+    """
+    result = search_backend(query_str, filters, limit=limit, offset=offset, sort=sort)
+
+    doc_ids = [hit["id"] for hit in result["hits"]]
+    doc_map = {
+        doc.id: doc
+        for doc in _listable(Document.query).filter(
+            Document.id.in_(doc_ids), Document.is_deleted == False
+        )
+    }
+    rows = []
+    for position, hit in enumerate(result["hits"], start=offset):
+        if hit["id"] in doc_map:
+            data = doc_to_dict(doc_map[hit["id"]])
+            data["highlights"] = hit["_formatted"]
+            rows.append((position, data))
+    return result, rows
+
+
+def _stream_search(query_str, filters, offset, sort="relevance"):
+    batch_size = current_app.config["API_MAX_PAGE_SIZE"]
+    while True:
+        result, rows = _search_hits(query_str, filters, batch_size, offset, sort)
+        for position, row in rows:
+            row["cursor"] = encode_cursor({"o": position + 1})
+            yield row
+        # total is an estimate; a short page is the reliable end of results
+        offset += len(result["hits"])
+        if len(result["hits"]) < batch_size:
+            return
+
+
 @api.route("/search", methods=["GET"])
 def search_documents():
-    from flask import request
+    query_str = request.args.get("q", "").strip()
+    filters = filters_from_args(request.args)
+    sort = sort_from_args(request.args)
+
+    # Without search terms there is nothing to rank: list matching documents
+    # newest first with keyset cursors instead
+    if not query_str and sort in ("relevance", "newest"):
+        return _document_page(
+            filtered_documents(filters),
+            "results",
+            query=query_str,
+            backend="database",
+            facets=None,
+        )
 
-    query_str = request.args.get("q", "")
-    category_id = request.args.get("category", type=int)
-    period_id = request.args.get("period", type=int)
-    tag_id = request.args.get("tag", type=int)
+    # Ranked results page by offset; the cursor keeps that opaque
+    cursor = request.args.get("cursor")
+    try:
+        offset = int(decode_cursor(cursor)["o"]) if cursor else 0
+    except (CursorError, KeyError, TypeError, ValueError):
+        return jsonify({"error": "Invalid cursor"}), 400
 
-    base_query = Document.query.filter_by(is_deleted=False)
+    if wants_ndjson():
+        return ndjson_response(_stream_search(query_str, filters, offset, sort))
 
-    if query_str:
-        search_term = f"%{query_str}%"
-        base_query = base_query.filter(
-            or_(
-                Document.title.ilike(search_term),
-                Document.original_filename.ilike(search_term),
-                Document.description.ilike(search_term),
-                Document.content_text.ilike(search_term),
-            )
-        )
+    per_page = page_size()
+    result, rows = _search_hits(query_str, filters, per_page, offset, sort)
+    next_offset = offset + len(result["hits"])
 
-    if category_id:
-        base_query = base_query.filter_by(category_id=category_id)
-    if period_id:
-        base_query = base_query.filter_by(academic_period_id=period_id)
-    if tag_id:
-        base_query = base_query.filter(Document.tags.any(id=tag_id))
+    return {
+        "results": [row for _, row in rows],
+        "total_count": result["total"],
+        "query": query_str,
+        "sort": sort,
+        "backend": result["backend"],
+        "facets": (
+            facet_counts(result["facets"]) if result["facets"] is not None else None
+        ),
+        "pagination": {
+            "per_page": per_page,
+            "next_cursor": (
+                encode_cursor({"o": next_offset})
+                if len(result["hits"]) == per_page
+                else None
+            ),
+        },
+    }
 
-    results = base_query.order_by(Document.uploaded_at.desc()).all()
 
+@api.route("/suggest", methods=["GET"])
+def suggest_completions():
+    query_str = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", 10, type=int) or 10, 20))
     return {
-        "results": [doc_to_dict(d) for d in results],
-        "total_count": len(results),
         "query": query_str,
+        "suggestions": suggest(query_str, limit) if query_str else [],
     }
 
 
@@ -147,11 +267,26 @@ def doc_to_dict(doc):
         "original_filename": doc.original_filename,
         "file_size": doc.file_size,
         "mime_type": doc.mime_type,
+        "checksum": doc.checksum,
         "description": doc.description,
         "category_id": doc.category_id,
         "academic_period_id": doc.academic_period_id,
         "uploaded_at": doc.uploaded_at.isoformat() if doc.uploaded_at else None,
         "tags": [t.name for t in doc.tags] if doc.tags else [],
+        "status": doc.status,
+    }
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "stage": job.stage,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "run_after": job.run_after.isoformat() if job.run_after else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
     }
 
 
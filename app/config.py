@@ -18,12 +18,108 @@ class Config:
     ALLOWED_EXTENSIONS = set(os.environ.get("ALLOWED_EXTENSIONS", "").split(","))
 
     SEARCH_RESULTS_PER_PAGE = int(os.environ.get("SEARCH_RESULTS_PER_PAGE") or 25)
+    # Words kept around each match in search result snippets
+    SEARCH_CROP_LENGTH = int(os.environ.get("SEARCH_CROP_LENGTH") or 50)
+    # Deepest result Meilisearch returns for a search (its maxTotalHits)
+    SEARCH_MAX_TOTAL_HITS = int(os.environ.get("SEARCH_MAX_TOTAL_HITS") or 10000)
+    API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE") or 200)
+    API_STREAM_BATCH_SIZE = int(os.environ.get("API_STREAM_BATCH_SIZE") or 500)
     AUDIT_LOG_ENABLED = os.environ.get("AUDIT_LOG_ENABLED", "true").lower() == "true"
 
     # Meilisearch
     MEILI_HTTP_ADDR = os.environ.get("MEILI_HTTP_ADDR") or "http://localhost:7700"
     MEILI_MASTER_KEY = os.environ.get("MEILI_MASTER_KEY") or "masterKey"
     MEILI_INDEX_NAME = os.environ.get("MEILI_INDEX_NAME") or "documents"
+    MEILI_TIMEOUT = float(os.environ.get("MEILI_TIMEOUT") or 10)
+    MEILI_CONNECT_TIMEOUT = float(os.environ.get("MEILI_CONNECT_TIMEOUT") or 2)
+    # "meilisearch" (database full-text search as fallback) or "database"
+    SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND") or "meilisearch"
+    # Postgres text search configuration for the search_vector column
+    FTS_LANGUAGE = os.environ.get("FTS_LANGUAGE") or "simple"
+    # Render search result cards from the index payload instead of loading rows
+    SEARCH_RENDER_FROM_INDEX = (
+        os.environ.get("SEARCH_RENDER_FROM_INDEX", "false").lower() == "true"
+    )
+
+    # Redis search result cache
+    REDIS_URL = os.environ.get("REDIS_URL") or "redis://localhost:6379/0"
+    REDIS_TIMEOUT = float(os.environ.get("REDIS_TIMEOUT") or 0.5)
+    SEARCH_CACHE_ENABLED = os.environ.get("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+    SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL") or 600)
+
+    # In-process typeahead index, refreshed by a background thread: incremental
+    # catch-up and full rebuild (seconds)
+    SUGGEST_REFRESH_INTERVAL = float(os.environ.get("SUGGEST_REFRESH_INTERVAL") or 5)
+    SUGGEST_REBUILD_INTERVAL = float(os.environ.get("SUGGEST_REBUILD_INTERVAL") or 3600)
+    # Tags, categories and correspondents are re-read this often (seconds)
+    SUGGEST_VOCABULARY_INTERVAL = float(os.environ.get("SUGGEST_VOCABULARY_INTERVAL") or 60)
+
+    # Auto-matching rules are re-read this often when changed by another process
+    AUTO_MATCH_REFRESH_INTERVAL = float(os.environ.get("AUTO_MATCH_REFRESH_INTERVAL") or 60)
+
+    # Near-duplicate detection: minimum estimated text similarity (0-1)
+    DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD") or 0.8)
+
+    # Background ingestion (scripts/worker.py)
+    INGEST_EAGER = os.environ.get("INGEST_EAGER", "false").lower() == "true"
+    INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS") or 5)
+    INGEST_RETRY_BACKOFF = int(os.environ.get("INGEST_RETRY_BACKOFF") or 30)
+    INGEST_JOB_TIMEOUT = int(os.environ.get("INGEST_JOB_TIMEOUT") or 1800)
+    INGEST_POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL") or 2)
+
+    # Search index sync through the outbox, drained by the worker
+    SEARCH_SYNC_BATCH_SIZE = int(os.environ.get("SEARCH_SYNC_BATCH_SIZE") or 500)
+    SEARCH_SYNC_RETRY_BACKOFF = int(os.environ.get("SEARCH_SYNC_RETRY_BACKOFF") or 5)
+    SEARCH_SYNC_MAX_BACKOFF = int(os.environ.get("SEARCH_SYNC_MAX_BACKOFF") or 3600)
+    # Confirmed outbox rows are kept this long for reindex replays (seconds)
+    SEARCH_OUTBOX_RETENTION = int(os.environ.get("SEARCH_OUTBOX_RETENTION") or 86400)
+
+    # OCR of scanned PDFs: pool size defaults to CPU count - 1
+    OCR_WORKERS = int(os.environ.get("OCR_WORKERS") or 0) or None
+    OCR_MAX_IN_FLIGHT = int(os.environ.get("OCR_MAX_IN_FLIGHT") or 0) or None
+    OCR_DPI = int(os.environ.get("OCR_DPI") or 200)
+
+    # Isolated extraction workers: per-MIME wall-clock (s) and memory (MB) limits
+    EXTRACTION_ISOLATED = os.environ.get("EXTRACTION_ISOLATED", "true").lower() == "true"
+    EXTRACTION_POOL_SIZE = int(os.environ.get("EXTRACTION_POOL_SIZE") or 2)
+    EXTRACTION_MAX_JOBS_PER_WORKER = int(
+        os.environ.get("EXTRACTION_MAX_JOBS_PER_WORKER") or 200
+    )
+    EXTRACTION_TIMEOUTS = {
+        "application/pdf": 900,
+        "image/": 300,
+        "text/plain": 30,
+        "default": int(os.environ.get("EXTRACTION_TIMEOUT") or 120),
+    }
+    EXTRACTION_MAX_RSS_MB = {
+        "application/pdf": 2048,
+        "image/": 1536,
+        "default": int(os.environ.get("EXTRACTION_MAX_RSS_MB") or 1024),
+    }
+
+    # Extracted-text cache, keyed by file hash (defaults to UPLOAD_FOLDER/.cache)
+    EXTRACTION_CACHE_ENABLED = (
+        os.environ.get("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+    )
+    EXTRACTION_CACHE_DIR = os.environ.get("EXTRACTION_CACHE_DIR")
+    EXTRACTION_CACHE_MAX_BYTES = int(
+        os.environ.get("EXTRACTION_CACHE_MAX_BYTES") or 2 * 1024**3
+    )
+
+    # First-page thumbnails/previews (defaults to UPLOAD_FOLDER/.cache/previews)
+    PREVIEW_SIZES = {"thumb": 320, "medium": 1200}
+    PREVIEW_CACHE_DIR = os.environ.get("PREVIEW_CACHE_DIR")
+    PREVIEW_CACHE_MAX_BYTES = int(
+        os.environ.get("PREVIEW_CACHE_MAX_BYTES") or 1024**3
+    )
+    # Rendering runs in the isolated extraction pool under its own limits
+    PREVIEW_TIMEOUTS = {
+        "application/pdf": 120,
+        "default": int(os.environ.get("PREVIEW_TIMEOUT") or 60),
+    }
+    PREVIEW_MAX_RSS_MB = {
+        "default": int(os.environ.get("PREVIEW_MAX_RSS_MB") or 1024),
+    }
 
     @staticmethod
     def init_app(app):
@@ -44,8 +140,21 @@ class ProductionConfig(Config):
         Config.init_app(app)
 
 
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite://"
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    WTF_CSRF_ENABLED = False
+    SEARCH_BACKEND = "database"
+    SEARCH_CACHE_ENABLED = False
+    EXTRACTION_ISOLATED = False
+    EXTRACTION_CACHE_ENABLED = False
+    INGEST_EAGER = False
+
+
 config = {
     "development": DevelopmentConfig,
     "production": ProductionConfig,
+    "testing": TestingConfig,
     "default": DevelopmentConfig,
 }
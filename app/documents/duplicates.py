@@ -0,0 +1,239 @@
+import re
+import hashlib
+from array import array
+from itertools import combinations
+from flask import current_app
+from sqlalchemy import and_, func
+from sqlalchemy.orm import aliased
+from app.extensions import db
+from app.models import Document, DocumentSignature, LshBucket
+
+# 128 MinHash values in 16 bands of 8: a pair shares a bucket in at least one
+# band with probability ~0.95 at 0.8 similarity (the default threshold), ~0.61
+# at 0.7 and ~0.06 at 0.5
+NUM_HASHES = 128
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+
+# Character shingles survive OCR noise better than word shingles
+SHINGLE_SIZE = 5
+# Texts with fewer distinct shingles are too short to compare meaningfully
+MIN_SHINGLES = 20
+
+EMPTY = 2**64 - 1
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "big")
+
+
+def _shingles(text):
+    normalized = " ".join(re.findall(r"\w+", (text or "").casefold()))
+    return {
+        normalized[i : i + SHINGLE_SIZE]
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(text):
+    """
+    One-permutation MinHash of the text: every shingle is hashed once into one
+    of NUM_HASHES bins, each keeping its minimum. Empty bins copy the next
+    filled bin so that short texts still compare consistently. Returns None
+    for texts too short to compare.
+    """
+    shingles = _shingles(text)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+
+    bins = [EMPTY] * NUM_HASHES
+    for shingle in shingles:
+        value = _hash(shingle.encode())
+        position = value % NUM_HASHES
+        value //= NUM_HASHES
+        if value < bins[position]:
+            bins[position] = value
+
+    signature = array("Q", bins)
+    for position in range(NUM_HASHES):
+        offset = 1
+        while signature[position] == EMPTY:
+            source = bins[(position + offset) % NUM_HASHES]
+            if source != EMPTY:
+                # Mixing in the offset keeps borrowed values distinct per bin
+                signature[position] = (source + offset * 0x9E3779B97F4A7C15) % EMPTY
+            offset += 1
+    return signature
+
+
+def band_buckets(signature):
+    """
+    Hashes each band of the signature to a signed 64-bit bucket id.
+    """
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS : (band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(rows, digest_size=8, person=b"band%d" % band)
+        buckets.append(int.from_bytes(digest.digest(), "big", signed=True))
+    return buckets
+
+
+def similarity(first, second):
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+def _load_signature(raw):
+    signature = array("Q")
+    signature.frombytes(raw)
+    return signature
+
+
+def store_signature(document):
+    """
+    Replaces the document's signature and LSH buckets. Documents without
+    enough text get neither. The caller owns the transaction.
+    """
+    remove_signature(document.id)
+    signature = minhash(document.content_text)
+    if signature is None:
+        return None
+
+    db.session.add(
+        DocumentSignature(document_id=document.id, signature=signature.tobytes())
+    )
+    db.session.add_all(
+        LshBucket(document_id=document.id, band=band, bucket=bucket)
+        for band, bucket in enumerate(band_buckets(signature))
+    )
+    return signature
+
+
+def remove_signature(document_id):
+    LshBucket.query.filter_by(document_id=document_id).delete()
+    DocumentSignature.query.filter_by(document_id=document_id).delete()
+
+
+def find_near_duplicates(document, threshold=None):
+    """
+    Live documents whose text is at least DUPLICATE_THRESHOLD similar, as
+    (document, similarity) pairs, most similar first. Only documents sharing
+    an LSH bucket are compared, so the cost does not grow with the archive.
+    """
+    if threshold is None:
+        threshold = current_app.config["DUPLICATE_THRESHOLD"]
+    own = db.session.get(DocumentSignature, document.id)
+    if own is None:
+        return []
+    signature = _load_signature(own.signature)
+
+    other = aliased(LshBucket)
+    candidate_ids = (
+        db.session.query(other.document_id)
+        .join(
+            LshBucket,
+            and_(LshBucket.band == other.band, LshBucket.bucket == other.bucket),
+        )
+        .filter(LshBucket.document_id == document.id, other.document_id != document.id)
+        .distinct()
+    )
+    rows = (
+        db.session.query(Document, DocumentSignature.signature)
+        .join(DocumentSignature, DocumentSignature.document_id == Document.id)
+        .filter(Document.id.in_(candidate_ids), Document.is_deleted == False)
+    )
+
+    matches = []
+    for candidate, raw in rows:
+        score = similarity(signature, _load_signature(raw))
+        if score >= threshold:
+            matches.append((candidate, score))
+    matches.sort(key=lambda match: (-match[1], match[0].id))
+    return matches
+
+
+def sign_missing_documents(batch_size=500):
+    """
+    Computes signatures for processed documents that have none yet, e.g. ones
+    archived before duplicate detection existed. Returns how many were signed.
+    """
+    signed = 0
+    last_id = 0
+    while True:
+        documents = (
+            Document.query.outerjoin(
+                DocumentSignature, DocumentSignature.document_id == Document.id
+            )
+            .filter(
+                DocumentSignature.document_id.is_(None),
+                Document.content_text.isnot(None),
+                Document.id > last_id,
+            )
+            .order_by(Document.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not documents:
+            return signed
+        for document in documents:
+            if store_signature(document) is not None:
+                signed += 1
+        last_id = documents[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+
+def sweep_duplicates(threshold=None, chunk_size=500):
+    """
+    Finds every near-duplicate pair among live documents. Candidate pairs
+    come from shared LSH buckets, never from comparing all documents with
+    each other. Returns (first_id, second_id, similarity) tuples, most
+    similar first.
+    """
+    if threshold is None:
+        threshold = current_app.config["DUPLICATE_THRESHOLD"]
+
+    shared = (
+        db.session.query(LshBucket.band, LshBucket.bucket)
+        .group_by(LshBucket.band, LshBucket.bucket)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    members = (
+        db.session.query(LshBucket.band, LshBucket.bucket, LshBucket.document_id)
+        .join(
+            shared,
+            and_(LshBucket.band == shared.c.band, LshBucket.bucket == shared.c.bucket),
+        )
+        .join(Document, Document.id == LshBucket.document_id)
+        .filter(Document.is_deleted == False)
+        .order_by(LshBucket.band, LshBucket.bucket, LshBucket.document_id)
+    )
+
+    pairs = set()
+    group, group_key = [], None
+    for band, bucket, document_id in members.yield_per(5000):
+        if (band, bucket) != group_key:
+            pairs.update(combinations(group, 2))
+            group, group_key = [], (band, bucket)
+        group.append(document_id)
+    pairs.update(combinations(group, 2))
+
+    document_ids = sorted({doc_id for pair in pairs for doc_id in pair})
+    signatures = {}
+    for start in range(0, len(document_ids), chunk_size):
+        chunk = document_ids[start : start + chunk_size]
+        for doc_id, raw in db.session.query(
+            DocumentSignature.document_id, DocumentSignature.signature
+        ).filter(DocumentSignature.document_id.in_(chunk)):
+            signatures[doc_id] = _load_signature(raw)
+
+    results = []
+    for first, second in pairs:
+        score = similarity(signatures[first], signatures[second])
+        if score >= threshold:
+            results.append((first, second, score))
+    results.sort(key=lambda result: (-result[2], result[0], result[1]))
+    return results
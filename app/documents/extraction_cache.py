@@ -0,0 +1,150 @@
+import os
+import gzip
+import hashlib
+import tempfile
+from flask import current_app, has_app_context
+
+# Bump whenever extraction output changes so stale entries are never served
+EXTRACTOR_VERSION = "2"
+
+EVICT_EVERY_WRITES = 100
+_writes_since_evict = 0
+
+
+def cache_dir():
+    if not has_app_context():
+        return None
+    if not current_app.config.get("EXTRACTION_CACHE_ENABLED", True):
+        return None
+    return current_app.config.get("EXTRACTION_CACHE_DIR") or os.path.join(
+        current_app.config["UPLOAD_FOLDER"], ".cache", "extraction"
+    )
+
+
+def file_checksum(file_path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def cache_key(checksum, mime_type, part="text"):
+    raw = f"{checksum}|{mime_type}|{part}|{EXTRACTOR_VERSION}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _entry_path(root, key):
+    return os.path.join(root, key[:2], f"{key}.txt.gz")
+
+
+def cache_get(key):
+    root = cache_dir()
+    if not root:
+        return None
+
+    path = _entry_path(root, key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            text = f.read()
+    except (FileNotFoundError, OSError, EOFError):
+        return None
+
+    # mtime doubles as the last-access time used for eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return text
+
+
+def cache_put(key, text):
+    global _writes_since_evict
+
+    root = cache_dir()
+    if not root:
+        return
+
+    path = _entry_path(root, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(text.encode("utf-8"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        current_app.logger.warning(f"Extraction cache write failed: {e}")
+        return
+
+    _writes_since_evict += 1
+    if _writes_since_evict >= EVICT_EVERY_WRITES:
+        _writes_since_evict = 0
+        evict_cache()
+
+
+def evict_cache(max_bytes=None):
+    """
+    Trims the cache to max_bytes by removing the least recently used entries.
+    Returns the number of entries removed.
+    """
+    if max_bytes is None:
+        max_bytes = current_app.config.get("EXTRACTION_CACHE_MAX_BYTES")
+    return evict_lru(cache_dir(), max_bytes, suffix=".txt.gz")
+
+
+def evict_lru(root, max_bytes, suffix=""):
+    """
+    Removes the oldest files (by mtime) under root until it holds at most max_bytes.
+    """
+    if not root or not os.path.isdir(root):
+        return 0
+
+    entries = []
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(suffix) or name.endswith(".part"):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    removed = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+class OcrPageCache:
+    """
+    Per-page OCR results for one file, so an interrupted or re-run OCR pass only
+    rasterizes the pages it has not seen before.
+    """
+
+    def __init__(self, checksum, dpi):
+        self.checksum = checksum
+        self.dpi = dpi
+
+    def _key(self, page_number):
+        return cache_key(self.checksum, "application/pdf", f"ocr:{self.dpi}:{page_number}")
+
+    def get(self, page_number):
+        return cache_get(self._key(page_number))
+
+    def put(self, page_number, text):
+        cache_put(self._key(page_number), text)
@@ -0,0 +1,269 @@
+import os
+import time
+import queue
+import atexit
+import signal
+import threading
+import multiprocessing
+from flask import current_app
+
+# Settings copied into each worker so it can run extraction without the web app
+WORKER_CONFIG_KEYS = [
+    "UPLOAD_FOLDER",
+    "OCR_WORKERS",
+    "OCR_MAX_IN_FLIGHT",
+    "OCR_DPI",
+    "EXTRACTION_CACHE_ENABLED",
+    "EXTRACTION_CACHE_DIR",
+    "EXTRACTION_CACHE_MAX_BYTES",
+    "PREVIEW_CACHE_DIR",
+    "PREVIEW_TIMEOUTS",
+]
+
+POLL_INTERVAL = 0.25
+
+
+class ExtractionError(Exception):
+    """
+    Raised when a file could not be extracted in the pool. Timeouts, memory-limit
+    kills, crashes and parser errors are deterministic for a given file, so they
+    are not retryable; only failing to get a worker at all is.
+    """
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _worker_main(conn, settings):
+    # Own process group, so a kill also takes down OCR pool children
+    os.setsid()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from flask import Flask
+    from app.documents.services import extract_text_cached
+    from app.documents.previews import render_preview_files
+
+    tasks = {"extract": extract_text_cached, "preview": render_preview_files}
+    app = Flask(__name__)
+    app.config.update(settings)
+
+    with app.app_context():
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                return
+            if job is None:
+                return
+
+            task, args = job
+            try:
+                conn.send(("ok", tasks[task](*args)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _process_tree_rss(pid):
+    """
+    Resident memory in bytes of pid and its descendants, read from /proc.
+    Returns None where /proc is unavailable.
+    """
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    stack = [pid]
+    try:
+        while stack:
+            current = stack.pop()
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+            children_path = f"/proc/{current}/task/{current}/children"
+            if os.path.exists(children_path):
+                with open(children_path) as f:
+                    stack.extend(int(child) for child in f.read().split())
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    except OSError:
+        return None
+    return total
+
+
+class _Worker:
+    def __init__(self, ctx, settings):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, settings), daemon=False
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class ExtractionPool:
+    """
+    Pre-started extraction processes, which also render previews. Each job runs
+    under a wall-clock timeout and a resident-memory cap; a worker that exceeds
+    either is killed and replaced, and workers are also recycled after
+    max_jobs_per_worker jobs to bound leaks.
+    """
+
+    def __init__(self, size, settings, max_jobs_per_worker=200):
+        self.size = size
+        self.settings = settings
+        self.max_jobs_per_worker = max_jobs_per_worker
+        # fork, not spawn: spawn re-imports __main__, which under `flask run`
+        # would start another server in every worker
+        self._ctx = multiprocessing.get_context("fork")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(_Worker(self._ctx, settings))
+
+    def extract(self, file_path, mime_type, checksum=None, timeout=120, max_rss=None):
+        return self.run(
+            "extract", (file_path, mime_type, checksum), timeout=timeout, max_rss=max_rss
+        )
+
+    def run(self, task, args, timeout=120, max_rss=None):
+        if self._closed:
+            raise ExtractionError("Extraction pool is shut down", retryable=True)
+
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise ExtractionError("No extraction worker available", retryable=True)
+
+        try:
+            worker.conn.send((task, args))
+            status, payload = self._wait(worker, timeout, max_rss)
+        except ExtractionError:
+            worker.kill()
+            worker = _Worker(self._ctx, self.settings)
+            raise
+        except (EOFError, OSError) as e:
+            worker.kill()
+            worker = _Worker(self._ctx, self.settings)
+            raise ExtractionError(f"Extraction worker crashed: {e}")
+        finally:
+            self._release(worker)
+
+        if status == "error":
+            raise ExtractionError(payload)
+        return payload
+
+    def _wait(self, worker, timeout, max_rss):
+        deadline = time.monotonic() + timeout
+        while not worker.conn.poll(POLL_INTERVAL):
+            if not worker.process.is_alive():
+                raise ExtractionError(
+                    f"Extraction worker exited with code {worker.process.exitcode}"
+                )
+            if time.monotonic() > deadline:
+                raise ExtractionError(f"Extraction timed out after {timeout}s")
+            if max_rss:
+                rss = _process_tree_rss(worker.process.pid)
+                if rss and rss > max_rss:
+                    raise ExtractionError(
+                        f"Extraction exceeded memory limit ({rss // 2**20} MB)"
+                    )
+        return worker.conn.recv()
+
+    def _release(self, worker):
+        worker.jobs += 1
+        if self._closed:
+            worker.stop()
+            return
+        if worker.jobs >= self.max_jobs_per_worker:
+            worker.stop()
+            worker = _Worker(self._ctx, self.settings)
+        self._idle.put(worker)
+
+    def shutdown(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            settings = {key: current_app.config.get(key) for key in WORKER_CONFIG_KEYS}
+            _pool = ExtractionPool(
+                current_app.config["EXTRACTION_POOL_SIZE"],
+                settings,
+                max_jobs_per_worker=current_app.config["EXTRACTION_MAX_JOBS_PER_WORKER"],
+            )
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def limit_for(limits, mime_type):
+    mime_type = mime_type or ""
+    if mime_type in limits:
+        return limits[mime_type]
+    family = mime_type.split("/")[0] + "/"
+    return limits.get(family, limits.get("default"))
+
+
+def extract_text_isolated(file_path, mime_type, checksum=None):
+    """
+    Runs extraction in the worker pool under the per-MIME timeout and memory cap.
+    Raises ExtractionError when the file could not be processed.
+    """
+    timeout = limit_for(current_app.config["EXTRACTION_TIMEOUTS"], mime_type)
+    max_rss_mb = limit_for(current_app.config["EXTRACTION_MAX_RSS_MB"], mime_type)
+
+    return get_extraction_pool().extract(
+        file_path,
+        mime_type,
+        checksum,
+        timeout=timeout,
+        max_rss=max_rss_mb * 2**20 if max_rss_mb else None,
+    )
+
+
+def render_previews_isolated(file_path, mime_type, checksum, sizes):
+    """
+    Renders previews in the worker pool under the per-MIME preview timeout and
+    memory cap. Raises ExtractionError when the file could not be rendered.
+    """
+    timeout = limit_for(current_app.config["PREVIEW_TIMEOUTS"], mime_type)
+    max_rss_mb = limit_for(current_app.config["PREVIEW_MAX_RSS_MB"], mime_type)
+
+    return get_extraction_pool().run(
+        "preview",
+        (file_path, mime_type, checksum, sizes),
+        timeout=timeout,
+        max_rss=max_rss_mb * 2**20 if max_rss_mb else None,
+    )
@@ -0,0 +1,246 @@
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_
+from app.extensions import db
+from app.models import IngestJob
+from app.documents.services import extract_text_content, run_auto_matching
+from app.documents.extraction_pool import ExtractionError, extract_text_isolated
+from app.documents.previews import render_previews
+from app.documents.duplicates import find_near_duplicates, store_signature
+from app.documents.related import refresh_related
+from app.search.outbox import queue_index_sync, sync_search_index
+
+INGEST_STAGES = ["extract", "match", "dedup", "related", "index", "preview"]
+
+
+def _stage_extract(document):
+    if not current_app.config["EXTRACTION_ISOLATED"]:
+        document.content_text = extract_text_content(
+            document.file_path, document.mime_type, checksum=document.checksum
+        )
+        return
+
+    try:
+        document.content_text = extract_text_isolated(
+            document.file_path, document.mime_type, checksum=document.checksum
+        )
+    except ExtractionError as e:
+        if e.retryable:
+            raise
+        # A poison file: keep its metadata searchable and record why text is missing
+        current_app.logger.warning(f"Extraction failed for document {document.id}: {e}")
+        document.content_text = None
+        document.processing_error = f"extract: {e}"
+
+
+def _stage_match(document):
+    run_auto_matching(document)
+
+
+def _stage_dedup(document):
+    store_signature(document)
+    db.session.flush()
+    duplicates = find_near_duplicates(document)
+    if duplicates:
+        current_app.logger.info(
+            f"Document {document.id} looks like a near-duplicate of "
+            f"{', '.join(str(d.id) for d, _ in duplicates)}"
+        )
+
+
+def _stage_related(document):
+    refresh_related(document)
+
+
+def _stage_index(document):
+    queue_index_sync(document)
+
+
+def _stage_preview(document):
+    # Previews are a convenience; a rendering failure must not fail the document
+    try:
+        render_previews(document)
+    except ExtractionError as e:
+        if e.retryable:
+            raise
+        current_app.logger.warning(f"Preview rendering failed for {document.id}: {e}")
+    except Exception as e:
+        current_app.logger.warning(f"Preview rendering failed for {document.id}: {e}")
+
+
+STAGE_HANDLERS = {
+    "extract": _stage_extract,
+    "match": _stage_match,
+    "dedup": _stage_dedup,
+    "related": _stage_related,
+    "index": _stage_index,
+    "preview": _stage_preview,
+}
+
+
+def enqueue_ingest(document, stage=None):
+    """
+    Queues the extraction/matching/indexing pipeline for a freshly stored document.
+    The caller owns the transaction, so the job row commits together with the document.
+    Pass a later stage to skip work that is already done (e.g. reused extracted text).
+    """
+    document.status = "processing"
+    document.processing_error = None
+
+    job = IngestJob(
+        document=document,
+        stage=stage or INGEST_STAGES[0],
+        max_attempts=current_app.config["INGEST_MAX_ATTEMPTS"],
+    )
+    db.session.add(job)
+    return job
+
+
+def enqueue_preview(document):
+    """
+    Queues preview rendering alone, for documents ingested before previews
+    existed. Returns None when a job for the document is already pending.
+    """
+    pending = IngestJob.query.filter(
+        IngestJob.document_id == document.id,
+        IngestJob.status.in_(("queued", "running")),
+    ).first()
+    if pending:
+        return None
+    job = IngestJob(document=document, stage="preview", max_attempts=1)
+    db.session.add(job)
+    return job
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next_job(worker_id=None):
+    """
+    Locks the oldest runnable job for this worker. Jobs left "running" by a worker
+    that died are picked up again once INGEST_JOB_TIMEOUT has passed.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=current_app.config["INGEST_JOB_TIMEOUT"])
+
+    job = (
+        IngestJob.query.filter(
+            or_(
+                and_(IngestJob.status == "queued", IngestJob.run_after <= now),
+                and_(IngestJob.status == "running", IngestJob.locked_at < stale_before),
+            )
+        )
+        .order_by(IngestJob.run_after, IngestJob.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+
+    if not job:
+        db.session.rollback()
+        return None
+
+    _lock_job(job, worker_id)
+    db.session.commit()
+    return job
+
+
+def _lock_job(job, worker_id=None):
+    job.status = "running"
+    job.locked_by = worker_id or worker_name()
+    job.locked_at = datetime.utcnow()
+    job.attempts = (job.attempts or 0) + 1
+
+
+def run_job_inline(job):
+    """
+    Runs a job inside the current request (INGEST_EAGER), e.g. for development
+    setups without a worker process. Failures still fall back to the queue.
+    """
+    _lock_job(job)
+    db.session.commit()
+    return run_job(job)
+
+
+def run_job(job):
+    """
+    Runs the remaining stages of a claimed job. Each completed stage is committed,
+    so a retry resumes at the stage that failed instead of re-running OCR.
+    """
+    document = job.document
+    job_id = job.id
+    stage = job.stage
+
+    try:
+        for stage in INGEST_STAGES[INGEST_STAGES.index(job.stage) :]:
+            job.stage = stage
+            STAGE_HANDLERS[stage](document)
+            job.locked_at = datetime.utcnow()
+            db.session.commit()
+
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+        job.last_error = document.processing_error
+        document.status = "failed" if document.processing_error else "ready"
+        db.session.commit()
+        return True
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ingest job {job_id} failed at {stage}: {e}")
+
+        # The rollback restored the last committed stage; resume at the failed one
+        job = db.session.get(IngestJob, job_id)
+        job.stage = stage
+        job.last_error = str(e)
+        job.locked_by = None
+        job.locked_at = None
+
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+            job.document.status = "failed"
+            job.document.processing_error = f"{stage}: {e}"
+        else:
+            backoff = current_app.config["INGEST_RETRY_BACKOFF"] * 2 ** (job.attempts - 1)
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=backoff)
+
+        db.session.commit()
+        return False
+
+
+def run_pending_jobs(limit=None, worker_id=None):
+    """
+    Drains runnable jobs and returns how many were processed.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job(worker_id)
+        if not job:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def run_worker(poll_interval=None, once=False):
+    worker_id = worker_name()
+    poll_interval = poll_interval or current_app.config["INGEST_POLL_INTERVAL"]
+    current_app.logger.info(f"Ingest worker {worker_id} started")
+
+    while True:
+        processed = run_pending_jobs(worker_id=worker_id)
+        try:
+            synced = sync_search_index()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Search index sync failed: {e}")
+            synced = 0
+        if once:
+            return processed
+        if not processed and not synced:
+            time.sleep(poll_interval)
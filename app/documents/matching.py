@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import deque
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import Tag, Correspondent
+
+
+def normalize(text):
+    """
+    Case-folds the text and collapses whitespace, so a rule matches across line
+    breaks and repeated spaces.
+    """
+    return " ".join((text or "").casefold().split())
+
+
+class Matcher:
+    """
+    Aho-Corasick automaton over the normalized names of every rule. One pass
+    over a text finds all rules whose name occurs as whole words, however
+    many rules there are.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        # State 0 is the root; goto[state] maps a character to the next state
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for rule in rules:
+            pattern = normalize(rule[2])
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append((len(pattern), rule))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = (
+                    self.output[next_state] + self.output[self.fail[next_state]]
+                )
+
+    def find(self, text):
+        """
+        Returns {(kind, id): occurrences} for every rule found in text as whole
+        words; "Final" does not match inside "Finalize".
+        """
+        text = normalize(text)
+        goto, fail, output = self.goto, self.fail, self.output
+        found = {}
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, rule in output[state]:
+                start = end - length + 1
+                if start > 0 and _is_word(text[start - 1]) and _is_word(text[start]):
+                    continue
+                if end + 1 < len(text) and _is_word(text[end + 1]) and _is_word(text[end]):
+                    continue
+                key = rule[:2]
+                found[key] = found.get(key, 0) + 1
+        return found
+
+
+def _is_word(char):
+    return char.isalnum() or char == "_"
+
+
+_matcher = None
+_checked_at = 0.0
+_stale = True
+_lock = threading.Lock()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_change(session, flush_context):
+    # Changes made in this process take effect on the next match
+    global _stale
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(instance, (Tag, Correspondent)):
+            continue
+        # Tagging a document touches tag.documents, which is not a rule change
+        if instance in session.dirty and not session.is_modified(
+            instance, include_collections=False
+        ):
+            continue
+        _stale = True
+        return
+
+
+def _load_rules():
+    rules = [("tag", t.id, t.name) for t in Tag.query.order_by(Tag.id)]
+    rules += [
+        ("correspondent", c.id, c.name)
+        for c in Correspondent.query.order_by(Correspondent.id)
+    ]
+    return rules
+
+
+def get_matcher():
+    """
+    Returns the process-wide matcher. It is rebuilt after this process changes
+    a tag or correspondent, and at most AUTO_MATCH_REFRESH_INTERVAL
+    seconds after another process does.
+    """
+    global _matcher, _checked_at, _stale
+    now = time.monotonic()
+    with _lock:
+        if (
+            _matcher is None
+            or _stale
+            or now - _checked_at > current_app.config["AUTO_MATCH_REFRESH_INTERVAL"]
+        ):
+            _stale = False
+            rules = _load_rules()
+            if _matcher is None or rules != _matcher.rules:
+                _matcher = Matcher(rules)
+            _checked_at = now
+        return _matcher
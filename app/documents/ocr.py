@@ -0,0 +1,74 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import pytesseract
+from pdf2image import convert_from_path
+
+
+def default_ocr_workers():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def _ocr_pdf_page(file_path, page_number, dpi):
+    """
+    Rasterizes and OCRs a single page. Runs in a pool process, so only one page
+    image per worker is ever held in memory.
+    """
+    images = convert_from_path(
+        file_path, dpi=dpi, first_page=page_number, last_page=page_number
+    )
+    try:
+        return "\n".join(pytesseract.image_to_string(image) for image in images)
+    finally:
+        for image in images:
+            image.close()
+
+
+def iter_pdf_ocr_pages(
+    file_path, page_count, workers=None, max_in_flight=None, dpi=200, page_cache=None
+):
+    """
+    Yields OCR text page by page, in page order. Pages are rasterized one at a time
+    inside a process pool with at most max_in_flight pages queued, so stopping the
+    generator early (e.g. once a text budget is met) cancels the remaining work.
+    Pages found in page_cache are served without touching the pool.
+    """
+    workers = workers or default_ocr_workers()
+    max_in_flight = max_in_flight or workers * 2
+
+    def cached(page_number):
+        return page_cache.get(page_number) if page_cache else None
+
+    def store(page_number, text):
+        if page_cache:
+            page_cache.put(page_number, text)
+        return text
+
+    if workers == 1:
+        for page_number in range(1, page_count + 1):
+            text = cached(page_number)
+            if text is None:
+                text = store(page_number, _ocr_pdf_page(file_path, page_number, dpi))
+            yield text
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        next_page = 1
+        try:
+            while pending or next_page <= page_count:
+                while next_page <= page_count and len(pending) < max_in_flight:
+                    text = cached(next_page)
+                    if text is None:
+                        future = pool.submit(_ocr_pdf_page, file_path, next_page, dpi)
+                    else:
+                        future = Future()
+                        future.set_result(text)
+                    pending.append((next_page, text is None, future))
+                    next_page += 1
+                page_number, is_new, future = pending.popleft()
+                text = future.result()
+                yield store(page_number, text) if is_new else text
+        finally:
+            for _, _, future in pending:
+                future.cancel()
@@ -0,0 +1,174 @@
+import os
+import tempfile
+from flask import current_app
+from PIL import Image
+from pdf2image import convert_from_path
+from app.documents.extraction_cache import evict_lru, file_checksum
+from app.documents.extraction_pool import (
+    ExtractionError,
+    limit_for,
+    render_previews_isolated,
+)
+
+PREVIEW_FORMAT = "JPEG"
+PREVIEW_EXTENSION = ".jpg"
+
+EVICT_EVERY_WRITES = 50
+_writes_since_evict = 0
+
+
+def preview_dir():
+    return current_app.config.get("PREVIEW_CACHE_DIR") or os.path.join(
+        current_app.config["UPLOAD_FOLDER"], ".cache", "previews"
+    )
+
+
+def supports_preview(mime_type):
+    mime_type = mime_type or ""
+    return mime_type == "application/pdf" or mime_type.startswith("image/")
+
+
+def preview_path(checksum, size):
+    """
+    Previews are addressed by file content, so deduplicated documents share them
+    and a URL for a given checksum never changes.
+    """
+    return os.path.join(preview_dir(), checksum[:2], f"{checksum}-{size}{PREVIEW_EXTENSION}")
+
+
+def failure_path(checksum):
+    # Rendering the same bytes fails the same way, so failures are cached too
+    return os.path.join(preview_dir(), checksum[:2], f"{checksum}.failed")
+
+
+def preview_failed(document):
+    return bool(document.checksum) and os.path.exists(failure_path(document.checksum))
+
+
+def forget_preview_failure(document):
+    """
+    Lets a reprocessed document try rendering again, e.g. after poppler was
+    installed.
+    """
+    if document.checksum and os.path.exists(failure_path(document.checksum)):
+        os.remove(failure_path(document.checksum))
+
+
+def _record_failure(checksum, error):
+    path = failure_path(checksum)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"{type(error).__name__}: {error}\n")
+
+
+def _first_page_image(file_path, mime_type, max_dimension):
+    if mime_type == "application/pdf":
+        timeout = limit_for(current_app.config["PREVIEW_TIMEOUTS"], mime_type)
+        images = convert_from_path(
+            file_path,
+            first_page=1,
+            last_page=1,
+            size=(max_dimension, None),
+            timeout=timeout,
+        )
+        return images[0] if images else None
+    return Image.open(file_path)
+
+
+def _save_preview(image, path, max_dimension):
+    image = image.copy()
+    image.thumbnail((max_dimension, max_dimension))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, PREVIEW_FORMAT, quality=80, optimize=True)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def render_preview_files(file_path, mime_type, checksum, sizes):
+    """
+    Writes the previews for {size name: max dimension}, rasterizing the first
+    page once at the largest size. Runs in the isolated worker pool.
+    """
+    image = _first_page_image(file_path, mime_type, max(sizes.values()))
+    if image is None:
+        raise ValueError("no page to render")
+    try:
+        for name, dimension in sizes.items():
+            _save_preview(image, preview_path(checksum, name), dimension)
+    finally:
+        image.close()
+    return list(sizes)
+
+
+def render_previews(document):
+    """
+    Renders every configured preview size for a document that does not have them
+    yet, in the isolated pool unless EXTRACTION_ISOLATED is off. A failure is
+    recorded and re-raised, and the file is not tried again; only not getting a
+    pool worker at all is left to a retry.
+    """
+    global _writes_since_evict
+
+    if not supports_preview(document.mime_type) or not os.path.exists(document.file_path):
+        return []
+
+    if not document.checksum:
+        document.checksum = file_checksum(document.file_path)
+
+    if preview_failed(document):
+        return []
+
+    sizes = current_app.config["PREVIEW_SIZES"]
+    missing = {
+        name: dimension
+        for name, dimension in sizes.items()
+        if not os.path.exists(preview_path(document.checksum, name))
+    }
+    if not missing:
+        return []
+
+    try:
+        if current_app.config["EXTRACTION_ISOLATED"]:
+            render_previews_isolated(
+                document.file_path, document.mime_type, document.checksum, missing
+            )
+        else:
+            render_preview_files(
+                document.file_path, document.mime_type, document.checksum, missing
+            )
+    except Exception as e:
+        if not (isinstance(e, ExtractionError) and e.retryable):
+            _record_failure(document.checksum, e)
+        raise
+
+    _writes_since_evict += len(missing)
+    if _writes_since_evict >= EVICT_EVERY_WRITES:
+        _writes_since_evict = 0
+        evict_lru(preview_dir(), current_app.config["PREVIEW_CACHE_MAX_BYTES"])
+
+    return list(missing)
+
+
+def get_preview_file(document, size):
+    """
+    Returns the path of a rendered preview, or None if it has not been
+    rendered. Nothing is rendered here: the caller queues missing previews
+    for the worker.
+    """
+    if size not in current_app.config["PREVIEW_SIZES"] or not document.checksum:
+        return None
+    path = preview_path(document.checksum, size)
+    if not os.path.exists(path):
+        return None
+    os.utime(path)
+    return path
@@ -0,0 +1,371 @@
+import re
+import heapq
+import math
+from collections import Counter, defaultdict
+from operator import itemgetter
+from sqlalchemy import or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import defer
+from app.extensions import db
+from app.models import (
+    Document,
+    DocumentTerm,
+    DocumentTermSet,
+    RelatedDocument,
+    TermDocumentFrequency,
+)
+
+# Terms kept per document vector, and the most frequent terms whose IDF is
+# looked up to choose them
+MAX_TERMS = 64
+CANDIDATE_TERMS = 256
+# Neighbours cached per document
+NEIGHBORS = 10
+MIN_SCORE = 0.05
+# A title word counts as this many occurrences in the text
+TITLE_BOOST = 3
+
+TOKEN_PATTERN = re.compile(r"\w{3,}")
+
+STOPWORDS = frozenset(
+    """
+    about above after again against all also and any are because been before
+    being below between both but can could did does doing down during each few
+    for from further had has have having her here hers herself him himself his
+    how into its itself just more most not now off once only other our ours
+    out over own same she should some such than that the their theirs them
+    then there these they this those through too under until very was were
+    what when where which while who whom why will with would you your yours
+    """.split()
+)
+
+
+def _tokens(text):
+    return [
+        token[:64]
+        for token in TOKEN_PATTERN.findall((text or "").casefold())
+        if token not in STOPWORDS
+    ]
+
+
+def term_counts(document):
+    counts = Counter(_tokens(document.content_text))
+    for token in _tokens(document.title):
+        counts[token] += TITLE_BOOST
+    return counts
+
+
+def candidate_terms(counts):
+    return [term for term, _ in counts.most_common(CANDIDATE_TERMS)]
+
+
+def _vector(counts, document_frequency, total):
+    """
+    The MAX_TERMS highest TF-IDF weights, L2-normalized so that the dot
+    product of two vectors is their cosine similarity.
+    """
+    weights = {
+        term: (1 + math.log(counts[term]))
+        * (math.log((total + 1) / (document_frequency.get(term, 0) + 1)) + 1)
+        for term in candidate_terms(counts)
+    }
+    top = heapq.nlargest(MAX_TERMS, weights.items(), key=itemgetter(1))
+    norm = math.sqrt(sum(weight * weight for _, weight in top)) or 1.0
+    return {term: weight / norm for term, weight in top}
+
+
+def _adjust_frequencies(terms, delta):
+    if terms:
+        TermDocumentFrequency.query.filter(
+            TermDocumentFrequency.term.in_(terms)
+        ).update(
+            {TermDocumentFrequency.documents: TermDocumentFrequency.documents + delta},
+            synchronize_session=False,
+        )
+
+
+def _insert(model):
+    # ON CONFLICT support, on the two databases the app runs on
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def _increment_frequencies(terms):
+    """
+    Adds one to each term's frequency, creating missing rows, in a single
+    upsert so concurrent refreshes adding the same new term do not collide.
+    """
+    if not terms:
+        return
+    statement = _insert(TermDocumentFrequency).values(
+        [{"term": term, "documents": 1} for term in sorted(terms)]
+    )
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TermDocumentFrequency.term],
+            set_={
+                "documents": TermDocumentFrequency.documents
+                + statement.excluded.documents
+            },
+        )
+    )
+
+
+def _count_terms(document_id, terms):
+    """
+    Makes the document count towards the frequencies of exactly these terms,
+    subtracting whatever it counted towards before. The document's term set
+    row is created first and then locked, so a web edit and the worker
+    refreshing the same document take turns instead of counting it twice.
+    """
+    db.session.execute(
+        _insert(DocumentTermSet)
+        .values(document_id=document_id, terms="")
+        .on_conflict_do_nothing(index_elements=[DocumentTermSet.document_id])
+    )
+    row = db.session.execute(
+        select(DocumentTermSet)
+        .filter_by(document_id=document_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalar_one()
+    old = set(row.terms.split())
+    new = set(terms)
+
+    _adjust_frequencies(old - new, -1)
+    _increment_frequencies(new - old)
+
+    if new:
+        row.terms = " ".join(sorted(new))
+    else:
+        db.session.delete(row)
+
+
+def _uncount_terms(document_id):
+    row = db.session.get(DocumentTermSet, document_id, with_for_update=True)
+    if row:
+        _adjust_frequencies(set(row.terms.split()), -1)
+        db.session.delete(row)
+
+
+def index_terms(document, document_frequency=None, total=None):
+    """
+    Replaces the document's stored vector and returns it. Frequencies come
+    from TermDocumentFrequency, updated for this document first, unless a
+    full rebuild passes the ones it counted up front.
+    """
+    DocumentTerm.query.filter_by(document_id=document.id).delete()
+    counts = term_counts(document)
+
+    if document_frequency is None:
+        candidates = candidate_terms(counts)
+        _count_terms(document.id, candidates)
+        db.session.flush()
+        document_frequency = dict(
+            db.session.query(
+                TermDocumentFrequency.term, TermDocumentFrequency.documents
+            ).filter(TermDocumentFrequency.term.in_(candidates))
+        )
+        total = DocumentTermSet.query.count()
+    if not counts:
+        return {}
+
+    vector = _vector(counts, document_frequency, total)
+    db.session.add_all(
+        DocumentTerm(document_id=document.id, term=term, weight=weight)
+        for term, weight in vector.items()
+    )
+    return vector
+
+
+def stored_vector(document_id):
+    return dict(
+        db.session.query(DocumentTerm.term, DocumentTerm.weight).filter_by(
+            document_id=document_id
+        )
+    )
+
+
+def nearest_documents(document_id, vector, limit=NEIGHBORS):
+    """
+    Top documents by cosine similarity, scored only from the postings of the
+    vector's own terms.
+    """
+    if not vector:
+        return []
+    scores = defaultdict(float)
+    postings = (
+        db.session.query(DocumentTerm.document_id, DocumentTerm.term, DocumentTerm.weight)
+        .join(Document, Document.id == DocumentTerm.document_id)
+        .filter(
+            DocumentTerm.term.in_(vector),
+            DocumentTerm.document_id != document_id,
+            Document.is_deleted == False,
+        )
+    )
+    for other_id, term, weight in postings:
+        scores[other_id] += vector[term] * weight
+    return [
+        (other_id, score)
+        for other_id, score in heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        if score >= MIN_SCORE
+    ]
+
+
+def store_neighbors(document_id, neighbors):
+    RelatedDocument.query.filter_by(document_id=document_id).delete()
+    db.session.add_all(
+        RelatedDocument(document_id=document_id, related_id=other_id, score=score)
+        for other_id, score in neighbors
+    )
+
+
+def _offer(document_id, neighbors):
+    """
+    Adds document_id to each neighbour's cached list where it now ranks among
+    that neighbour's top NEIGHBORS, so earlier documents learn about it
+    without being recomputed.
+    """
+    scores = dict(neighbors)
+    lists = defaultdict(list)
+    for row in RelatedDocument.query.filter(
+        RelatedDocument.document_id.in_(scores)
+    ):
+        lists[row.document_id].append(row)
+
+    for other_id, score in scores.items():
+        rows = lists[other_id]
+        existing = next((row for row in rows if row.related_id == document_id), None)
+        if existing is not None:
+            existing.score = score
+            continue
+        if len(rows) >= NEIGHBORS:
+            weakest = min(rows, key=lambda row: row.score)
+            if weakest.score >= score:
+                continue
+            db.session.delete(weakest)
+        db.session.add(
+            RelatedDocument(document_id=other_id, related_id=document_id, score=score)
+        )
+
+
+def refresh_related(document):
+    """
+    Re-indexes the document's terms, recomputes its neighbour list and offers
+    it to its neighbours. The caller owns the transaction.
+    """
+    vector = index_terms(document)
+    db.session.flush()
+    neighbors = nearest_documents(document.id, vector)
+    store_neighbors(document.id, neighbors)
+    _offer(document.id, neighbors)
+
+
+def remove_related(document_id):
+    """
+    Takes a trashed or purged document out of the index. Lists it appeared in
+    are recomputed, so they do not shrink below NEIGHBORS. The caller owns
+    the transaction.
+    """
+    _uncount_terms(document_id)
+    DocumentTerm.query.filter_by(document_id=document_id).delete()
+    affected = [
+        other_id
+        for (other_id,) in db.session.query(RelatedDocument.document_id).filter(
+            RelatedDocument.related_id == document_id
+        )
+    ]
+    RelatedDocument.query.filter(
+        or_(
+            RelatedDocument.document_id == document_id,
+            RelatedDocument.related_id == document_id,
+        )
+    ).delete()
+    db.session.flush()
+    for other_id in affected:
+        store_neighbors(other_id, nearest_documents(other_id, stored_vector(other_id)))
+
+
+def related_documents(document, limit=5):
+    """
+    The cached neighbours of a document that are not in the trash, as
+    (document, score) pairs, best first.
+    """
+    return (
+        db.session.query(Document, RelatedDocument.score)
+        .options(defer(Document.content_text))
+        .join(RelatedDocument, RelatedDocument.related_id == Document.id)
+        .filter(RelatedDocument.document_id == document.id, Document.is_deleted == False)
+        .order_by(RelatedDocument.score.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def _iter_documents(batch_size):
+    last_id = 0
+    while True:
+        batch = (
+            Document.query.filter(Document.is_deleted == False, Document.id > last_id)
+            .order_by(Document.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+        db.session.commit()
+        db.session.expunge_all()
+
+
+def rebuild_related(batch_size=200):
+    """
+    Rebuilds every vector and neighbour list. Document frequencies are
+    recounted over the whole archive first, so early and late documents are
+    weighted alike. Returns the number of documents processed.
+    """
+    trashed = db.session.query(Document.id).filter(Document.is_deleted == True)
+    DocumentTerm.query.filter(DocumentTerm.document_id.in_(trashed)).delete(
+        synchronize_session=False
+    )
+    RelatedDocument.query.filter(
+        or_(
+            RelatedDocument.document_id.in_(trashed),
+            RelatedDocument.related_id.in_(trashed),
+        )
+    ).delete(synchronize_session=False)
+    DocumentTermSet.query.delete()
+    TermDocumentFrequency.query.delete()
+    db.session.commit()
+
+    document_frequency = Counter()
+    processed = 0
+    for batch in _iter_documents(batch_size):
+        for document in batch:
+            terms = candidate_terms(term_counts(document))
+            if terms:
+                document_frequency.update(terms)
+                db.session.add(
+                    DocumentTermSet(document_id=document.id, terms=" ".join(sorted(terms)))
+                )
+            processed += 1
+
+    frequencies = list(document_frequency.items())
+    for start in range(0, len(frequencies), 5000):
+        db.session.add_all(
+            TermDocumentFrequency(term=term, documents=count)
+            for term, count in frequencies[start : start + 5000]
+        )
+        db.session.commit()
+    total = DocumentTermSet.query.count()
+
+    for batch in _iter_documents(batch_size):
+        for document in batch:
+            index_terms(document, document_frequency, total)
+
+    for batch in _iter_documents(batch_size):
+        for document in batch:
+            neighbors = nearest_documents(document.id, stored_vector(document.id))
+            store_neighbors(document.id, neighbors)
+    return processed
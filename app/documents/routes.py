@@ -1,7 +1,6 @@
 import os
 import uuid
 import json
-import magic
 from datetime import datetime
 from flask import (
     render_template,
@@ -16,17 +15,38 @@ from flask import (
 from flask_login import login_required, current_user
 from sqlalchemy import or_
 from app.extensions import db
-from app.models import Document, Category, AcademicPeriod, Tag, AuditLog, Correspondent
+from app.models import (
+    Document,
+    Category,
+    AcademicPeriod,
+    Tag,
+    AuditLog,
+    Correspondent,
+    IngestJob,
+)
 from app.documents.forms import DocumentUploadForm, DocumentEditForm
 from app.documents.services import (
-    extract_text_content,
+    find_duplicate_blob,
+    file_reference_count,
     get_file_preview,
     log_audit_action,
-    run_auto_matching,
+    release_document_file,
+    store_upload,
+)
+from app.documents.jobs import enqueue_ingest, enqueue_preview, run_job_inline
+from app.documents.previews import (
+    forget_preview_failure,
+    get_preview_file,
+    preview_failed,
+    supports_preview,
 )
-from app.search.services import index_document, delete_document_from_index
+from app.documents.duplicates import find_near_duplicates, remove_signature
+from app.documents.related import refresh_related, related_documents, remove_related
+from app.search.outbox import queue_index_sync
 from . import documents
 
+documents.add_app_template_global(supports_preview)
+
 
 @documents.route("/")
 @login_required
@@ -119,10 +139,6 @@ def upload():
         if file:
             original_filename = file.filename
             stored_filename = f"{uuid.uuid4()}{os.path.splitext(original_filename)[1]}"
-            mime_type = magic.from_buffer(file.read(1024), mime=True)
-            file.seek(0)
-            file_size = len(file.read())
-            file.seek(0)
 
             title = os.path.splitext(original_filename)[0]
             category = Category.query.get(form.category.data)
@@ -131,12 +147,16 @@ def upload():
             folder_path = os.path.join(
                 current_app.config["UPLOAD_FOLDER"], period.folder_name, category.slug
             )
-            os.makedirs(folder_path, exist_ok=True)
-
             file_path = os.path.join(folder_path, stored_filename)
-            file.save(file_path)
+            stored = store_upload(file.stream, file_path)
+            mime_type = stored["mime_type"]
 
-            content_text = extract_text_content(file_path, mime_type)
+            # Identical bytes already archived: share that blob and its text
+            duplicate = find_duplicate_blob(stored["checksum"], stored["file_size"])
+            if duplicate:
+                os.remove(file_path)
+                file_path = duplicate.file_path
+                stored_filename = duplicate.stored_filename
 
             tags = []
             if form.tags.data:
@@ -159,9 +179,9 @@ def upload():
                 original_filename=original_filename,
                 stored_filename=stored_filename,
                 file_path=file_path,
-                file_size=file_size,
+                file_size=stored["file_size"],
                 mime_type=mime_type,
-                content_text=content_text,
+                checksum=stored["checksum"],
                 category_id=category.id,
                 academic_period_id=period.id,
                 correspondent_id=form.correspondent.data
@@ -174,18 +194,35 @@ def upload():
             for tag in tags:
                 doc.tags.append(tag)
 
-            # Auto-matching
-            run_auto_matching(doc)
-
+            # Extraction, auto-matching and indexing run in the ingest worker
             db.session.add(doc)
+            if duplicate and duplicate.status == "ready":
+                doc.content_text = duplicate.content_text
+                job = enqueue_ingest(doc, stage="match")
+            else:
+                job = enqueue_ingest(doc)
             db.session.commit()
 
-            # Index in Meilisearch
-            index_document(doc)
-
-            log_audit_action("upload", doc.id, {"filename": original_filename})
-
-            flash(f'Document "{doc.title}" uploaded successfully!', "success")
+            details = {"filename": original_filename}
+            if duplicate:
+                details["duplicate_of"] = duplicate.id
+            log_audit_action("upload", doc.id, details)
+
+            if current_app.config["INGEST_EAGER"]:
+                run_job_inline(job)
+                flash(f'Document "{doc.title}" uploaded successfully!', "success")
+                duplicates = find_near_duplicates(doc)
+                if duplicates:
+                    flash(
+                        f'"{doc.title}" looks like a near-duplicate of '
+                        f"{len(duplicates)} archived document(s).",
+                        "warning",
+                    )
+            else:
+                flash(
+                    f'Document "{doc.title}" uploaded and queued for processing.',
+                    "success",
+                )
             return redirect(url_for("documents.list"))
 
     if current_period:
@@ -203,9 +240,32 @@ def detail(doc_id):
 
     log_audit_action("view", doc.id)
 
-    preview = get_file_preview(doc.file_path, doc.mime_type)
+    preview = get_file_preview(doc.file_path, doc.mime_type, doc.content_text)
+    duplicates = find_near_duplicates(doc)
+    preview_missing = (
+        supports_preview(doc.mime_type) and get_preview_file(doc, "medium") is None
+    )
+
+    return render_template(
+        "documents/detail.html",
+        document=doc,
+        preview=preview,
+        preview_missing=preview_missing,
+        duplicates=duplicates,
+        related=related_documents(doc),
+    )
+
 
-    return render_template("documents/detail.html", document=doc, preview=preview)
+@documents.route("/<int:doc_id>/duplicates")
+@login_required
+def duplicates(doc_id):
+    doc = Document.query.filter_by(id=doc_id, is_deleted=False).first_or_404()
+    return render_template(
+        "documents/duplicates.html",
+        document=doc,
+        duplicates=find_near_duplicates(doc),
+        threshold=current_app.config["DUPLICATE_THRESHOLD"],
+    )
 
 
 @documents.route("/<int:doc_id>/download")
@@ -220,6 +280,53 @@ def download(doc_id):
     )
 
 
+@documents.route("/<int:doc_id>/preview/<size>")
+@login_required
+def preview_image(doc_id, size):
+    doc = Document.query.filter_by(id=doc_id, is_deleted=False).first_or_404()
+
+    path = get_preview_file(doc, size)
+    if path:
+        # Preview URLs carry the content hash, so they can be cached indefinitely
+        return send_file(path, mimetype="image/jpeg", max_age=31536000, conditional=True)
+
+    if (
+        size not in current_app.config["PREVIEW_SIZES"]
+        or not supports_preview(doc.mime_type)
+        or preview_failed(doc)
+    ):
+        abort(404)
+
+    # Rendered by the worker after ingest or on request; show a placeholder meanwhile
+    response = send_file(
+        os.path.join(current_app.static_folder, "img", "preview-pending.svg"),
+        mimetype="image/svg+xml",
+    )
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@documents.route("/<int:doc_id>/preview", methods=["POST"])
+@login_required
+def render_preview(doc_id):
+    doc = Document.query.filter_by(id=doc_id, is_deleted=False).first_or_404()
+
+    if not supports_preview(doc.mime_type):
+        abort(404)
+
+    forget_preview_failure(doc)
+    job = enqueue_preview(doc)
+    db.session.commit()
+    if job is None:
+        flash(f'Document "{doc.title}" is already being processed.', "info")
+    elif current_app.config["INGEST_EAGER"]:
+        run_job_inline(job)
+    else:
+        flash(f'Preview of "{doc.title}" queued for rendering.', "success")
+
+    return redirect(url_for("documents.detail", doc_id=doc.id))
+
+
 @documents.route("/<int:doc_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit(doc_id):
@@ -248,6 +355,7 @@ def edit(doc_id):
     ]
 
     if form.validate_on_submit():
+        title_changed = doc.title != form.title.data
         doc.title = form.title.data
         doc.description = form.description.data
         doc.correspondent_id = (
@@ -269,10 +377,12 @@ def edit(doc_id):
             os.makedirs(new_folder_path, exist_ok=True)
             new_file_path = os.path.join(new_folder_path, doc.stored_filename)
 
-            if os.path.exists(doc.file_path):
-                os.rename(doc.file_path, new_file_path)
+            # A deduplicated blob stays put while other documents reference it
+            if not file_reference_count(doc.file_path, exclude_id=doc.id):
+                if os.path.exists(doc.file_path):
+                    os.rename(doc.file_path, new_file_path)
+                doc.file_path = new_file_path
 
-            doc.file_path = new_file_path
             doc.category_id = new_category.id
             doc.academic_period_id = new_period.id
 
@@ -291,11 +401,12 @@ def edit(doc_id):
         doc.tags = new_tags
         doc.updated_at = datetime.utcnow()
 
+        # Title words are weighted into the related-documents vector
+        if title_changed:
+            refresh_related(doc)
+        queue_index_sync(doc)
         db.session.commit()
 
-        # Update index in Meilisearch
-        index_document(doc)
-
         log_audit_action("edit", doc.id, {"changes": form.data})
 
         flash(f'Document "{doc.title}" updated successfully!', "success")
@@ -323,17 +434,33 @@ def delete(doc_id):
     doc.is_deleted = True
     doc.deleted_at = datetime.utcnow()
 
+    remove_related(doc.id)
+    queue_index_sync(doc)
     db.session.commit()
 
-    # Remove from Meilisearch index
-    delete_document_from_index(doc.id)
-
     log_audit_action("delete", doc.id)
 
     flash(f'Document "{doc.title}" moved to trash.', "info")
     return redirect(url_for("documents.list"))
 
 
+@documents.route("/<int:doc_id>/reprocess", methods=["POST"])
+@login_required
+def reprocess(doc_id):
+    doc = Document.query.filter_by(id=doc_id, is_deleted=False).first_or_404()
+
+    if doc.status == "processing":
+        flash(f'Document "{doc.title}" is already being processed.', "info")
+    else:
+        forget_preview_failure(doc)
+        enqueue_ingest(doc)
+        db.session.commit()
+        log_audit_action("reprocess", doc.id)
+        flash(f'Document "{doc.title}" queued for processing.', "success")
+
+    return redirect(url_for("documents.detail", doc_id=doc.id))
+
+
 @documents.route("/trash")
 @login_required
 def trash():
@@ -353,17 +480,42 @@ def restore(doc_id):
     doc.is_deleted = False
     doc.deleted_at = None
 
+    refresh_related(doc)
+    queue_index_sync(doc)
     db.session.commit()
 
-    # Re-index in Meilisearch
-    index_document(doc)
-
     log_audit_action("restore", doc.id)
 
     flash(f'Document "{doc.title}" restored successfully!', "success")
     return redirect(url_for("documents.detail", doc_id=doc.id))
 
 
+@documents.route("/<int:doc_id>/purge", methods=["POST"])
+@login_required
+def purge(doc_id):
+    doc = Document.query.filter_by(id=doc_id, is_deleted=True).first_or_404()
+    title = doc.title
+
+    # Keep the audit trail, but detach it from the row being removed
+    AuditLog.query.filter_by(document_id=doc.id).update({"document_id": None})
+    IngestJob.query.filter_by(document_id=doc.id).delete()
+    remove_signature(doc.id)
+    remove_related(doc.id)
+    doc.tags = []
+    file_removed = release_document_file(doc)
+    queue_index_sync(doc)
+    db.session.delete(doc)
+    db.session.commit()
+
+    log_audit_action(
+        "purge",
+        details={"document_id": doc_id, "title": title, "file_removed": file_removed},
+    )
+
+    flash(f'Document "{title}" permanently deleted.', "info")
+    return redirect(url_for("documents.trash"))
+
+
 @documents.route("/<int:doc_id>/editor", methods=["GET", "POST"])
 @login_required
 def editor(doc_id):
@@ -385,6 +537,7 @@ def editor(doc_id):
     ]
 
     if form.validate_on_submit():
+        title_changed = doc.title != form.title.data
         doc.title = form.title.data
         doc.description = form.description.data
         doc.correspondent_id = (
@@ -406,9 +559,10 @@ def editor(doc_id):
             )
             os.makedirs(new_folder_path, exist_ok=True)
             new_file_path = os.path.join(new_folder_path, doc.stored_filename)
-            if os.path.exists(doc.file_path):
-                os.rename(doc.file_path, new_file_path)
-            doc.file_path = new_file_path
+            if not file_reference_count(doc.file_path, exclude_id=doc.id):
+                if os.path.exists(doc.file_path):
+                    os.rename(doc.file_path, new_file_path)
+                doc.file_path = new_file_path
             doc.category_id = new_category.id
             doc.academic_period_id = new_period.id
 
@@ -425,8 +579,10 @@ def editor(doc_id):
                     new_tags.append(tag)
         doc.tags = new_tags
 
+        if title_changed:
+            refresh_related(doc)
+        queue_index_sync(doc)
         db.session.commit()
-        index_document(doc)
         flash(f'Document "{doc.title}" updated.', "success")
         return redirect(url_for("documents.editor", doc_id=doc.id))
 
@@ -435,7 +591,7 @@ def editor(doc_id):
     form.correspondent.data = doc.correspondent_id or 0
     form.tags.data = ", ".join([t.name for t in doc.tags])
 
-    preview = get_file_preview(doc.file_path, doc.mime_type)
+    preview = get_file_preview(doc.file_path, doc.mime_type, doc.content_text)
     return render_template(
         "documents/editor.html", form=form, document=doc, preview=preview
     )
@@ -1,63 +1,331 @@
 import os
+import re
+import hashlib
+import tempfile
+import zipfile
+import mimetypes
 import subprocess
+from xml.etree import ElementTree
+import magic
 import pytesseract
-from pdf2image import convert_from_path
+from flask import current_app, has_app_context
 from PIL import Image
 from PyPDF2 import PdfReader
 from docx import Document as DocxDocument
+from openpyxl import load_workbook
+from app.documents.ocr import iter_pdf_ocr_pages
+from app.documents.extraction_cache import (
+    OcrPageCache,
+    cache_dir,
+    cache_get,
+    cache_key,
+    cache_put,
+    file_checksum,
+)
 
 
-def extract_text_content(file_path, mime_type):
-    text = ""
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MIME_SNIFF_BYTES = 2048
+MAX_TEXT_LENGTH = 100000
+TEXT_READ_CHUNK = 64 * 1024
 
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PPTX_MIME = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+# Main part of each OOXML package, for files libmagic only sees as a zip
+OOXML_PARTS = {
+    "word/document.xml": DOCX_MIME,
+    "xl/workbook.xml": XLSX_MIME,
+    "ppt/presentation.xml": PPTX_MIME,
+}
+GENERIC_MIME_TYPES = {"application/zip", "application/octet-stream"}
+PPTX_SLIDE_PATTERN = re.compile(r"^ppt/slides/slide(\d+)\.xml$")
+DRAWINGML_TEXT = "{http://schemas.openxmlformats.org/drawingml/2006/main}t"
+
+
+def _config(key, default=None):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def store_upload(stream, file_path, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Streams an upload to file_path in fixed-size chunks, computing size, SHA-256
+    and the sniffed MIME type on the way. The data lands in a temp file in the
+    target folder and is fsynced and renamed into place, so a partial upload never
+    appears under the final name.
+    """
+    folder = os.path.dirname(file_path)
+    os.makedirs(folder, exist_ok=True)
+
+    sha256 = hashlib.sha256()
+    file_size = 0
+    head = b""
+
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".upload-", suffix=".part")
     try:
-        if mime_type == "application/pdf":
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-
-            # If no text was extracted, try OCR
-            if not text.strip():
-                try:
-                    images = convert_from_path(file_path)
-                    for image in images:
-                        text += pytesseract.image_to_string(image) + "\n"
-                except Exception as ocr_e:
-                    print(f"OCR failed for PDF {file_path}: {ocr_e}")
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                if len(head) < MIME_SNIFF_BYTES:
+                    head += chunk[: MIME_SNIFF_BYTES - len(head)]
+                sha256.update(chunk)
+                file_size += len(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        # mkstemp creates 0600 files; match what FileStorage.save() used to produce
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-        elif mime_type.startswith("image/"):
-            text = pytesseract.image_to_string(Image.open(file_path))
+    return {
+        "file_size": file_size,
+        "checksum": sha256.hexdigest(),
+        "mime_type": refine_mime_type(file_path, magic.from_buffer(head, mime=True)),
+    }
 
-        elif mime_type in [
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        ]:
-            doc = DocxDocument(file_path)
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
 
-        elif mime_type == "text/plain":
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
+def refine_mime_type(file_path, mime_type):
+    """
+    Resolves OOXML files that the MIME sniff reports as a plain zip or as
+    octet-stream, as it does for software-written workbooks whose first
+    MIME_SNIFF_BYTES hold no Office part names. The package's main part
+    decides, then the file extension; anything else is returned unchanged.
+    """
+    if mime_type not in GENERIC_MIME_TYPES:
+        return mime_type
+    try:
+        with zipfile.ZipFile(file_path) as package:
+            names = set(package.namelist())
+        for part, ooxml_mime in OOXML_PARTS.items():
+            if part in names:
+                return ooxml_mime
+    except (OSError, zipfile.BadZipFile):
+        pass
+    guessed, _ = mimetypes.guess_type(file_path)
+    if guessed in OOXML_PARTS.values():
+        return guessed
+    return mime_type
 
-        elif mime_type == "application/msword":
-            try:
-                result = subprocess.run(
-                    ["antiword", file_path], capture_output=True, text=True, timeout=30
-                )
-                if result.returncode == 0:
-                    text = result.stdout
-            except FileNotFoundError:
-                pass
 
+def find_duplicate_blob(checksum, file_size):
+    """
+    Returns an existing document whose stored file has identical content, so a
+    re-upload can point at that file (and its extracted text) instead of keeping
+    another copy. Trashed documents still hold their file and are valid sources.
+    """
+    from app.models import Document
+
+    candidates = (
+        Document.query.filter_by(checksum=checksum, file_size=file_size)
+        .order_by(Document.id)
+        .all()
+    )
+    # Prefer a fully processed copy so its extracted text can be reused
+    for doc in sorted(candidates, key=lambda d: d.status != "ready"):
+        if os.path.exists(doc.file_path):
+            return doc
+    return None
+
+
+def file_reference_count(file_path, exclude_id=None):
+    """
+    Number of document rows (including trashed ones) that point at file_path.
+    """
+    from app.models import Document
+
+    query = Document.query.filter(Document.file_path == file_path)
+    if exclude_id is not None:
+        query = query.filter(Document.id != exclude_id)
+    return query.count()
+
+
+def release_document_file(document):
+    """
+    Removes the stored file for a document that is being purged, unless another
+    document still references the same blob.
+    """
+    if file_reference_count(document.file_path, exclude_id=document.id):
+        return False
+    if os.path.exists(document.file_path):
+        os.remove(document.file_path)
+    return True
+
+
+def extract_text_content(file_path, mime_type, checksum=None):
+    """
+    Returns the searchable text of a stored file, or "" if extraction fails.
+    """
+    try:
+        return extract_text_cached(file_path, mime_type, checksum)
     except Exception as e:
         print(f"Text extraction error for {file_path}: {e}")
+        return ""
+
+
+def extract_text_cached(file_path, mime_type, checksum=None):
+    """
+    Like extract_text_content, but lets extraction errors propagate. Results are
+    cached by content hash, MIME type and EXTRACTOR_VERSION, so re-extracting a
+    known file skips PyPDF2/python-docx/Tesseract entirely. Failures are not
+    cached, since they may be transient (missing binary, I/O error).
+    """
+    use_cache = cache_dir() is not None
+    if use_cache:
+        try:
+            checksum = checksum or file_checksum(file_path)
+        except OSError:
+            use_cache = False
+
+    if use_cache:
+        key = cache_key(checksum, mime_type)
+        cached = cache_get(key)
+        if cached is not None:
+            return cached
+
+    text = _extract_text(file_path, mime_type, checksum if use_cache else None)
+    text = text.strip()[:MAX_TEXT_LENGTH]
+    if use_cache:
+        cache_put(key, text)
+    return text
+
+
+def _extract_text(file_path, mime_type, checksum=None, budget=MAX_TEXT_LENGTH):
+    """
+    Pulls chunks from the format's generator until the character budget is met
+    and joins them once, so work is bounded by the budget rather than file size.
+    """
+    chunks = _iter_text_chunks(file_path, mime_type, checksum)
+    parts = []
+    size = 0
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            size += len(chunk)
+            if size >= budget:
+                break
+    finally:
+        chunks.close()
+    return "".join(parts)
+
+
+def _iter_text_chunks(file_path, mime_type, checksum=None):
+    # Documents stored before the upload sniff refined zips
+    mime_type = refine_mime_type(file_path, mime_type)
+    if mime_type == "application/pdf":
+        yield from _iter_pdf_text(file_path, checksum)
+
+    elif mime_type.startswith("image/"):
+        with Image.open(file_path) as image:
+            yield pytesseract.image_to_string(image)
+
+    elif mime_type == DOCX_MIME:
+        doc = DocxDocument(file_path)
+        for paragraph in doc.paragraphs:
+            yield paragraph.text + "\n"
+
+    elif mime_type == XLSX_MIME:
+        yield from _iter_xlsx_text(file_path)
 
-    return text.strip()[:100000]
+    elif mime_type == PPTX_MIME:
+        yield from _iter_pptx_text(file_path)
 
+    elif mime_type in ["text/plain", "text/csv"]:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            while True:
+                chunk = f.read(TEXT_READ_CHUNK)
+                if not chunk:
+                    break
+                yield chunk
 
-def get_file_preview(file_path, mime_type):
+    elif mime_type == "application/msword":
+        # Raise rather than yield nothing, so an empty result is never cached
+        # for a file antiword did not actually read
+        try:
+            result = subprocess.run(
+                ["antiword", file_path], capture_output=True, text=True, timeout=30
+            )
+        except FileNotFoundError:
+            raise RuntimeError("antiword is not installed")
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"antiword exited with code {result.returncode}: {result.stderr.strip()}"
+            )
+        yield result.stdout
+
+
+def _iter_xlsx_text(file_path):
+    """
+    Streams worksheet rows with openpyxl's read-only mode, which parses the sheet
+    XML lazily instead of loading the whole workbook.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f"{sheet.title}\n"
+            for row in sheet.iter_rows(values_only=True):
+                values = [str(value) for value in row if value is not None]
+                if values:
+                    yield "\t".join(values) + "\n"
+    finally:
+        workbook.close()
+
+
+def _iter_pptx_text(file_path):
+    """
+    Streams slide text one slide at a time straight from the package XML.
+    """
+    with zipfile.ZipFile(file_path) as package:
+        slides = sorted(
+            (name for name in package.namelist() if PPTX_SLIDE_PATTERN.match(name)),
+            key=lambda name: int(PPTX_SLIDE_PATTERN.match(name).group(1)),
+        )
+        for name in slides:
+            parts = []
+            with package.open(name) as slide_xml:
+                for _, element in ElementTree.iterparse(slide_xml):
+                    if element.tag == DRAWINGML_TEXT and element.text:
+                        parts.append(element.text)
+                    element.clear()
+            if parts:
+                yield " ".join(parts) + "\n"
+
+
+def _iter_pdf_text(file_path, checksum=None):
+    reader = PdfReader(file_path)
+    found_text = False
+    for page in reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            found_text = found_text or bool(page_text.strip())
+            yield page_text + "\n"
+
+    # If no text was extracted, try OCR
+    if not found_text:
+        dpi = _config("OCR_DPI", 200)
+        ocr_pages = iter_pdf_ocr_pages(
+            file_path,
+            len(reader.pages),
+            workers=_config("OCR_WORKERS"),
+            max_in_flight=_config("OCR_MAX_IN_FLIGHT"),
+            dpi=dpi,
+            page_cache=OcrPageCache(checksum, dpi) if checksum else None,
+        )
+        try:
+            for page_text in ocr_pages:
+                yield page_text + "\n"
+        finally:
+            ocr_pages.close()
+
+
+def get_file_preview(file_path, mime_type, content_text=None):
     preview = {"type": "unknown", "content": None}
 
     try:
@@ -67,6 +335,10 @@ def get_file_preview(file_path, mime_type):
             preview["type"] = "image"
         elif mime_type in ["text/plain", "text/csv", "text/html", "application/json"]:
             preview["type"] = "text"
+            # Text files were already read at ingest; avoid reopening them per view
+            if content_text:
+                preview["content"] = content_text[:5000]
+                return preview
             try:
                 with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
                     preview["content"] = f.read(5000)
@@ -107,26 +379,42 @@ def log_audit_action(action, document_id=None, details=None, user_id=None):
 
 def run_auto_matching(document):
     """
-    Paperless-like feature: Automatically suggest or assign tags/category based on content.
+    Paperless-like feature: assigns tags, and a correspondent if the document
+    has none, whose names occur as whole words in its title or text. All rules
+    are matched in a single pass (see matching.py). Returns the names of the
+    tags added.
     """
-    from app.models import Tag, Category
+    from app.models import Tag, Correspondent
     from app.extensions import db
+    from app.documents.matching import get_matcher
 
-    content = (document.content_text or "").lower()
-    title = (document.title or "").lower()
-    combined = f"{title} {content}"
-
-    # Simple keyword-based matching
-    all_tags = Tag.query.all()
+    found = get_matcher().find(f"{document.title or ''} {document.content_text or ''}")
     suggested_tags = []
+    changed = False
 
-    for tag in all_tags:
-        if tag.name.lower() in combined:
-            if tag not in document.tags:
+    tag_ids = sorted(rule_id for kind, rule_id in found if kind == "tag")
+    current = {tag.id for tag in document.tags}
+    for tag_id in tag_ids:
+        if tag_id not in current:
+            tag = db.session.get(Tag, tag_id)
+            if tag is not None:
                 document.tags.append(tag)
                 suggested_tags.append(tag.name)
+                changed = True
+
+    # The most frequently mentioned correspondent wins
+    hits = [
+        (count, -rule_id)
+        for (kind, rule_id), count in found.items()
+        if kind == "correspondent"
+    ]
+    if hits and document.correspondent_id is None:
+        correspondent = db.session.get(Correspondent, -max(hits)[1])
+        if correspondent is not None:
+            document.correspondent = correspondent
+            changed = True
 
-    if suggested_tags:
+    if changed:
         db.session.commit()
 
     return suggested_tags
@@ -14,7 +14,7 @@ from flask_login import login_required, current_user
 from app.extensions import db
 from app.models import LetterTemplate, Document, Category, AcademicPeriod
 from app.engines.template_engine import get_template_variables, generate_document
-from app.search.services import index_document
+from app.search.outbox import queue_index_sync
 from . import engines
 
 
@@ -139,11 +139,9 @@ def generate():
         )
 
         db.session.add(doc)
+        queue_index_sync(doc)
         db.session.commit()
 
-        # Index in Meilisearch
-        index_document(doc)
-
         flash("Document generated and archived successfully!", "success")
         return redirect(url_for("engines.workbench", template_id=template.id))
 
@@ -98,9 +98,12 @@ class Document(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.BigInteger)
     mime_type = db.Column(db.String(100))
+    checksum = db.Column(db.String(64), index=True)  # SHA-256 of the stored file
     content_text = db.Column(db.Text)
     description = db.Column(db.Text)
     metadata_json = db.Column(db.Text)
+    # File a bulk import copied this document from, so a resumed run skips it
+    source_path = db.Column(db.String(1024), index=True)
 
     # Year/Month Steroids
     year = db.Column(db.Integer, index=True)
@@ -121,6 +124,14 @@ class Document(db.Model):
     is_deleted = db.Column(db.Boolean, default=False)
     deleted_at = db.Column(db.DateTime)
 
+    # Ingestion pipeline: "processing" until a worker has extracted, matched and
+    # indexed the file, then "ready" (or "failed" once retries are exhausted)
+    status = db.Column(db.String(20), default="ready", index=True)
+    processing_error = db.Column(db.Text)
+
+    # Keyset pagination walks (uploaded_at, id) newest first
+    __table_args__ = (db.Index("ix_document_uploaded_at_id", "uploaded_at", "id"),)
+
     category = db.relationship("Category", backref="documents")
     academic_period = db.relationship("AcademicPeriod", backref="documents")
     correspondent = db.relationship("Correspondent", backref="documents")
@@ -152,6 +163,133 @@ document_tag = db.Table(
 )
 
 
+class IngestJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), nullable=False)
+    stage = db.Column(db.String(20), nullable=False, default="extract")
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=5)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    document = db.relationship("Document", backref="ingest_jobs")
+
+    def __repr__(self):
+        return f"<IngestJob {self.id} {self.stage}/{self.status}>"
+
+
+class SearchOutbox(db.Model):
+    """
+    A pending search-index change for one document, written in the same
+    transaction as the change itself. No foreign key: purged documents still
+    need their deletion sent.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default="pending", index=True)
+    task_uid = db.Column(db.Integer, index=True)
+    attempts = db.Column(db.Integer, default=0)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SearchOutbox {self.document_id} {self.status}>"
+
+
+class DocumentSignature(db.Model):
+    """
+    MinHash signature of a document's extracted text, used to find near
+    duplicates. Its LSH band hashes live in LshBucket.
+    """
+
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), primary_key=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<DocumentSignature {self.document_id}>"
+
+
+class LshBucket(db.Model):
+    """
+    One band of a document's signature hashed to a bucket. Documents sharing
+    any (band, bucket) are near-duplicate candidates.
+    """
+
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (db.Index("ix_lsh_bucket_band_bucket", "band", "bucket"),)
+
+    def __repr__(self):
+        return f"<LshBucket {self.document_id} {self.band}>"
+
+
+class DocumentTerm(db.Model):
+    """
+    One weighted term of a document's TF-IDF vector. Indexed by term, the
+    table is the inverted index used to find related documents.
+    """
+
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), primary_key=True)
+    term = db.Column(db.String(64), primary_key=True)
+    weight = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.Index("ix_document_term_term", "term"),)
+
+    def __repr__(self):
+        return f"<DocumentTerm {self.document_id} {self.term}>"
+
+
+class TermDocumentFrequency(db.Model):
+    """
+    Number of documents whose candidate terms include the term: the document
+    frequency behind related-document IDF weights, kept current on every
+    index and removal so incremental and full rebuilds weigh terms alike.
+    """
+
+    term = db.Column(db.String(64), primary_key=True)
+    documents = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<TermDocumentFrequency {self.term} {self.documents}>"
+
+
+class DocumentTermSet(db.Model):
+    """
+    The candidate terms a document counts towards TermDocumentFrequency,
+    space separated, so they can be subtracted when it is re-indexed or
+    removed.
+    """
+
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), primary_key=True)
+    terms = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f"<DocumentTermSet {self.document_id}>"
+
+
+class RelatedDocument(db.Model):
+    """
+    Cached nearest neighbour of a document by TF-IDF cosine similarity.
+    """
+
+    document_id = db.Column(db.Integer, db.ForeignKey("document.id"), primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey("document.id"), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f"<RelatedDocument {self.document_id} -> {self.related_id}>"
+
+
 class AuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     admin_user_id = db.Column(db.Integer, db.ForeignKey("admin_user.id"))
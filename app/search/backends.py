@@ -0,0 +1,454 @@
+import re
+from datetime import date, datetime, time, timedelta
+from flask import current_app
+from markupsafe import escape
+from sqlalchemy import bindparam, cast, column, func, literal_column, table, text
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from app.extensions import db
+from app.models import Document, Category
+from app.search.services import (
+    CARD_FIELDS,
+    FACETS,
+    MARK_END,
+    MARK_START,
+    build_filters,
+    category_ancestry,
+    highlight_content,
+    search_documents,
+)
+
+# Column weights: title and filename rank above description, description above body
+FTS_WEIGHTS = {
+    "title": 10.0,
+    "original_filename": 8.0,
+    "description": 4.0,
+    "content_text": 1.0,
+}
+
+SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS document_fts USING fts5(
+        title, original_filename, description, content_text,
+        content='document', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS document_fts_insert AFTER INSERT ON document BEGIN
+        INSERT INTO document_fts(rowid, title, original_filename, description, content_text)
+        VALUES (new.id, new.title, new.original_filename, new.description, new.content_text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS document_fts_delete AFTER DELETE ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, original_filename, description, content_text)
+        VALUES ('delete', old.id, old.title, old.original_filename, old.description, old.content_text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS document_fts_update
+    AFTER UPDATE OF title, original_filename, description, content_text ON document BEGIN
+        INSERT INTO document_fts(document_fts, rowid, title, original_filename, description, content_text)
+        VALUES ('delete', old.id, old.title, old.original_filename, old.description, old.content_text);
+        INSERT INTO document_fts(rowid, title, original_filename, description, content_text)
+        VALUES (new.id, new.title, new.original_filename, new.description, new.content_text);
+    END
+    """,
+]
+
+
+# Result orders: Meilisearch sort expressions and the matching database order.
+# "relevance" keeps the ranking and only applies when there is a query.
+SORTS = {
+    "relevance": None,
+    "newest": ["uploaded_at:desc"],
+    "oldest": ["uploaded_at:asc"],
+    "title": ["title:asc"],
+}
+SORT_COLUMNS = {
+    "newest": (Document.uploaded_at.desc(), Document.id.desc()),
+    "oldest": (Document.uploaded_at.asc(), Document.id.asc()),
+    "title": (Document.title.asc(), Document.id.asc()),
+}
+
+
+def filters_from_args(args):
+    """
+    Reads the search filters from request arguments. Malformed values are
+    ignored rather than rejected, like the id filters always were.
+    """
+    month = args.get("month", type=int)
+    return {
+        "category": args.get("category", type=int),
+        "period": args.get("period", type=int),
+        "tag": args.get("tag", type=int),
+        "correspondent": args.get("correspondent", type=int),
+        "date_from": args.get("date_from", type=date.fromisoformat),
+        "date_to": args.get("date_to", type=date.fromisoformat),
+        "year": args.get("year", type=int),
+        "month": month if month and 1 <= month <= 12 else None,
+    }
+
+
+def sort_from_args(args):
+    sort = args.get("sort", "relevance")
+    return sort if sort in SORTS else "relevance"
+
+
+def uploaded_range(filters):
+    """
+    The date_from/date_to filters as a half-open datetime range, both days
+    included.
+    """
+    date_from, date_to = filters.get("date_from"), filters.get("date_to")
+    return (
+        datetime.combine(date_from, time.min) if date_from else None,
+        datetime.combine(date_to + timedelta(days=1), time.min) if date_to else None,
+    )
+
+
+def _fts_language():
+    language = current_app.config["FTS_LANGUAGE"]
+    if not re.fullmatch(r"[a-z_]+", language):
+        raise ValueError(f"Invalid FTS_LANGUAGE: {language!r}")
+    return language
+
+
+def _postgres_fts_ddl(language):
+    vector = " || ".join(
+        f"setweight(to_tsvector('{language}'::regconfig, coalesce({col}, '')), '{weight}')"
+        for col, weight in [
+            ("title", "A"),
+            ("original_filename", "A"),
+            ("description", "B"),
+            ("content_text", "D"),
+        ]
+    )
+    return [
+        f"ALTER TABLE document ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({vector}) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_document_search_vector "
+        "ON document USING GIN (search_vector)",
+    ]
+
+
+def install_fulltext():
+    """
+    Creates the database full-text index if it is missing: a generated tsvector
+    column with a GIN index on Postgres, an FTS5 table kept in sync by triggers
+    on SQLite. Run by scripts/init-db.py; safe to run again.
+    """
+    dialect = db.engine.dialect.name
+    try:
+        if dialect == "postgresql":
+            for statement in _postgres_fts_ddl(_fts_language()):
+                db.session.execute(text(statement))
+        elif dialect == "sqlite":
+            created = not db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = 'document_fts'")
+            ).first()
+            for statement in SQLITE_FTS_DDL:
+                db.session.execute(text(statement))
+            if created:
+                # Index the rows that existed before the table did
+                db.session.execute(
+                    text("INSERT INTO document_fts(document_fts) VALUES ('rebuild')")
+                )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Database full-text index unavailable: {e}")
+
+
+def _fulltext_dialect():
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'document_fts'")
+        ).first()
+        return dialect if exists else None
+    if dialect == "postgresql":
+        exists = db.session.execute(
+            text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'document' AND column_name = 'search_vector'"
+            )
+        ).first()
+        return dialect if exists else None
+    return None
+
+
+def _render_marks(value):
+    if not value:
+        return value
+    return str(escape(value)).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def _fts5_match(query):
+    """
+    Builds an FTS5 MATCH expression from free text: every word must match, and
+    the last one may be a prefix. Quoting each term keeps FTS5 syntax out.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def filtered_documents(filters):
+    query = Document.query.filter(Document.is_deleted == False)
+    if filters.get("category"):
+        category_ids = [
+            c.id
+            for c in Category.query.all()
+            if filters["category"] in category_ancestry(c)
+        ]
+        query = query.filter(Document.category_id.in_(category_ids))
+    if filters.get("period"):
+        query = query.filter(Document.academic_period_id == filters["period"])
+    if filters.get("tag"):
+        query = query.filter(Document.tags.any(id=filters["tag"]))
+    if filters.get("correspondent"):
+        query = query.filter(Document.correspondent_id == filters["correspondent"])
+    uploaded_from, uploaded_before = uploaded_range(filters)
+    if uploaded_from:
+        query = query.filter(Document.uploaded_at >= uploaded_from)
+    if uploaded_before:
+        query = query.filter(Document.uploaded_at < uploaded_before)
+    if filters.get("year"):
+        query = query.filter(Document.year == filters["year"])
+    if filters.get("month"):
+        query = query.filter(Document.month == filters["month"])
+    return query
+
+
+def _sqlite_search(query, match, limit, offset, sort="relevance"):
+    fts = table("document_fts", column("rowid"))
+    rank = func.bm25(literal_column("document_fts"), *FTS_WEIGHTS.values())
+    matched = (
+        query.join(fts, fts.c.rowid == Document.id)
+        .filter(text("document_fts MATCH :match"))
+        .params(match=match)
+    )
+    total = matched.count()
+    order = SORT_COLUMNS.get(sort, (rank, Document.id.desc()))
+    doc_ids = [
+        doc_id
+        for (doc_id,) in matched.with_entities(Document.id)
+        .order_by(*order)
+        .limit(limit)
+        .offset(offset)
+    ]
+    if not doc_ids:
+        return total, doc_ids, {}
+
+    rows = db.session.execute(
+        text(
+            "SELECT rowid, highlight(document_fts, 0, :start, :end), "
+            "snippet(document_fts, 3, :start, :end, '', :tokens) "
+            "FROM document_fts WHERE document_fts MATCH :match AND rowid IN :ids"
+        ).bindparams(bindparam("ids", expanding=True)),
+        {
+            "match": match,
+            "start": MARK_START,
+            "end": MARK_END,
+            # FTS5 snippets are at most 64 tokens
+            "tokens": min(current_app.config["SEARCH_CROP_LENGTH"], 64),
+            "ids": doc_ids,
+        },
+    )
+    formatted = {
+        row[0]: {"title": _render_marks(row[1]), "content": _render_marks(row[2])}
+        for row in rows
+    }
+    return total, doc_ids, formatted
+
+
+def _postgres_search(query, text_query, limit, offset, sort="relevance"):
+    language = cast(_fts_language(), REGCONFIG)
+    vector = literal_column("document.search_vector")
+    tsquery = func.websearch_to_tsquery(language, text_query)
+
+    matched = query.filter(vector.op("@@")(tsquery))
+    total = matched.count()
+    order = SORT_COLUMNS.get(
+        sort, (func.ts_rank_cd(vector, tsquery).desc(), Document.id.desc())
+    )
+    doc_ids = [
+        doc_id
+        for (doc_id,) in matched.with_entities(Document.id)
+        .order_by(*order)
+        .limit(limit)
+        .offset(offset)
+    ]
+    if not doc_ids:
+        return total, doc_ids, {}
+
+    options = f'StartSel="{MARK_START}", StopSel="{MARK_END}"'
+    crop_length = max(current_app.config["SEARCH_CROP_LENGTH"], 2)
+    rows = db.session.query(
+        Document.id,
+        func.ts_headline(language, Document.title, tsquery, f"{options}, HighlightAll=true"),
+        func.ts_headline(
+            language,
+            func.coalesce(Document.content_text, ""),
+            tsquery,
+            f"{options}, MaxWords={crop_length}, MinWords={crop_length // 2}, "
+            "MaxFragments=1",
+        ),
+    ).filter(Document.id.in_(doc_ids))
+    formatted = {
+        doc_id: {"title": _render_marks(title), "content": _render_marks(content)}
+        for doc_id, title, content in rows
+    }
+    return total, doc_ids, formatted
+
+
+def database_search(query, filters, limit=20, offset=0, sort="relevance"):
+    """
+    Ranked full-text search in the database itself, used when Meilisearch is
+    unavailable or disabled. Falls back to substring matching on databases
+    without a full-text index. Facet counts are not computed.
+    """
+    documents = filtered_documents(filters)
+    query = (query or "").strip()
+    dialect = _fulltext_dialect() if query else None
+    match = _fts5_match(query) if dialect == "sqlite" else query
+
+    if dialect == "sqlite" and match:
+        total, doc_ids, formatted = _sqlite_search(documents, match, limit, offset, sort)
+    elif dialect == "postgresql":
+        total, doc_ids, formatted = _postgres_search(documents, match, limit, offset, sort)
+    else:
+        if query:
+            pattern = f"%{query}%"
+            documents = documents.filter(
+                Document.title.ilike(pattern)
+                | Document.original_filename.ilike(pattern)
+                | Document.description.ilike(pattern)
+            )
+        total = documents.count()
+        doc_ids = [
+            doc_id
+            for (doc_id,) in documents.with_entities(Document.id)
+            .order_by(*SORT_COLUMNS.get(sort, SORT_COLUMNS["newest"]))
+            .limit(limit)
+            .offset(offset)
+        ]
+        formatted = {}
+
+    return {
+        "backend": "database",
+        "total": total,
+        "hits": [
+            {"id": doc_id, "_formatted": formatted.get(doc_id, {})} for doc_id in doc_ids
+        ],
+        "facets": None,
+    }
+
+
+def meilisearch_search(
+    query, filters, limit=20, offset=0, highlight_fields=None, sort="relevance"
+):
+    """
+    Searches Meilisearch with facet counts. Returns None when it is unavailable.
+    """
+    uploaded_from, uploaded_before = uploaded_range(filters)
+    results = search_documents(
+        query,
+        filters=build_filters(
+            filters.get("category"),
+            filters.get("period"),
+            filters.get("tag"),
+            filters.get("correspondent"),
+            uploaded_from=uploaded_from,
+            uploaded_before=uploaded_before,
+            year=filters.get("year"),
+            month=filters.get("month"),
+        ),
+        limit=limit,
+        offset=offset,
+        facets=list(FACETS.values()),
+        sort=SORTS.get(sort),
+    )
+    if results is None:
+        return None
+    return {
+        "backend": "meilisearch",
+        "total": results.estimated_total_hits or 0,
+        "hits": [
+            {
+                "id": int(hit["id"]),
+                "document": {field: hit.get(field) for field in CARD_FIELDS},
+                "_formatted": {
+                    field: _render_marks(value) if isinstance(value, str) else value
+                    for field, value in hit.get("_formatted", {}).items()
+                    if highlight_fields is None or field in highlight_fields
+                },
+            }
+            for hit in results.hits
+        ],
+        "facets": results.facet_distribution or {},
+    }
+
+
+def search(query, filters, limit=20, offset=0, highlight_fields=None, sort="relevance"):
+    """
+    Runs a search on the configured backend. With SEARCH_BACKEND=meilisearch
+    the database answers whenever Meilisearch cannot. Without a query there
+    is no relevance to rank by, so results come newest first.
+    """
+    if not (query or "").strip() and sort == "relevance":
+        sort = "newest"
+    if current_app.config["SEARCH_BACKEND"] != "database":
+        result = meilisearch_search(
+            query, filters, limit, offset, highlight_fields, sort
+        )
+        if result is not None:
+            return result
+    return database_search(query, filters, limit, offset, sort)
+
+
+def highlight_document(document, query):
+    """
+    The document's full extracted text as HTML with every match of query
+    marked, from Meilisearch or else the database full-text index. Text
+    that cannot be highlighted is returned escaped.
+    """
+    content = document.content_text or ""
+    query = (query or "").strip()
+    if not query or not content:
+        return str(escape(content))
+
+    if current_app.config["SEARCH_BACKEND"] != "database":
+        marked = highlight_content(document.id, query, MARK_START, MARK_END)
+        if marked is not None:
+            return _render_marks(marked)
+
+    dialect = _fulltext_dialect()
+    marked = None
+    if dialect == "sqlite" and _fts5_match(query):
+        marked = db.session.execute(
+            text(
+                "SELECT highlight(document_fts, 3, :start, :end) FROM document_fts "
+                "WHERE document_fts MATCH :match AND rowid = :id"
+            ),
+            {
+                "match": _fts5_match(query),
+                "start": MARK_START,
+                "end": MARK_END,
+                "id": document.id,
+            },
+        ).scalar()
+    elif dialect == "postgresql":
+        language = cast(_fts_language(), REGCONFIG)
+        marked = db.session.query(
+            func.ts_headline(
+                language,
+                Document.content_text,
+                func.websearch_to_tsquery(language, query),
+                f'StartSel="{MARK_START}", StopSel="{MARK_END}", HighlightAll=true',
+            )
+        ).filter(Document.id == document.id).scalar()
+    return _render_marks(marked) if marked else str(escape(content))
@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import threading
+import redis
+from flask import current_app
+
+INDEX_VERSION_KEY = "search:index_version"
+# Part of every key, bumped when the cached hit format changes (2: escaped highlights)
+CACHE_FORMAT = 2
+
+_redis = None
+_redis_key = None
+_redis_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Returns the process-wide Redis client, or None when the cache is disabled.
+    """
+    global _redis, _redis_key
+    if not current_app.config["SEARCH_CACHE_ENABLED"]:
+        return None
+
+    key = (os.getpid(), current_app.config["REDIS_URL"])
+    with _redis_lock:
+        if _redis is None or _redis_key != key:
+            _redis = redis.Redis.from_url(
+                current_app.config["REDIS_URL"],
+                socket_timeout=current_app.config["REDIS_TIMEOUT"],
+                socket_connect_timeout=current_app.config["REDIS_TIMEOUT"],
+            )
+            _redis_key = key
+        return _redis
+
+
+def normalize_query(query):
+    return " ".join((query or "").casefold().split())
+
+
+def bump_index_version():
+    """
+    Invalidates every cached result set. Called whenever index contents change;
+    old entries are never read again and expire on their own.
+    """
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.incr(INDEX_VERSION_KEY)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Could not bump search index version: {e}")
+
+
+def search_cache_key(query, filters, page, sort="relevance"):
+    """
+    Builds the cache key for a search, or returns None when Redis is unavailable.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        version = int(client.get(INDEX_VERSION_KEY) or 0)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Search cache unavailable: {e}")
+        return None
+
+    raw = json.dumps(
+        {
+            "q": normalize_query(query),
+            "filters": {k: v for k, v in sorted(filters.items()) if v is not None},
+            "page": page,
+            "sort": sort,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return f"search:f{CACHE_FORMAT}:v{version}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def get_cached_search(key):
+    if key is None:
+        return None
+    try:
+        value = get_redis().get(key)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Search cache read failed: {e}")
+        return None
+    return json.loads(value) if value else None
+
+
+def cache_search(key, result):
+    """
+    Stores a result page: the total, hit ids with their highlighted fields and
+    the facet counts.
+    """
+    if key is None:
+        return
+    value = json.dumps(result)
+    try:
+        get_redis().set(key, value, ex=current_app.config["SEARCH_CACHE_TTL"])
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Search cache write failed: {e}")
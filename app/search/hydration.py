@@ -0,0 +1,91 @@
+from datetime import datetime
+from sqlalchemy.orm import defer, joinedload, selectinload
+from app.extensions import db
+from app.models import Document, Category, Tag
+
+
+class IndexedDocument:
+    """
+    A result card built from a search hit instead of a Document row. It has
+    the attributes search/index.html reads from a Document.
+    """
+
+    def __init__(self, doc_id, fields, categories, tags):
+        self.id = doc_id
+        self.title = fields.get("title")
+        self.original_filename = fields.get("original_filename")
+        self.mime_type = fields.get("mime_type")
+        self.checksum = fields.get("checksum")
+        self.category = categories.get(fields.get("category_id"))
+        self.tags = [tags[t] for t in fields.get("tag_ids") or [] if t in tags]
+        uploaded_at = fields.get("uploaded_at")
+        self.uploaded_at = datetime.fromtimestamp(uploaded_at) if uploaded_at else None
+
+
+def _load_categories():
+    # Loading every category puts each parent in the identity map, so
+    # full_path() walks the chain without a query per level
+    return {c.id: c for c in Category.query.all()}
+
+
+def hydrate_documents(doc_ids):
+    """
+    Loads live documents for a result page with their category chain,
+    period and tags in a fixed number of queries. Returns {id: Document}.
+    """
+    if not doc_ids:
+        return {}
+    _load_categories()
+    documents = (
+        Document.query.options(
+            defer(Document.content_text),
+            joinedload(Document.category),
+            joinedload(Document.academic_period),
+            selectinload(Document.tags),
+        )
+        .filter(Document.id.in_(doc_ids), Document.is_deleted == False)
+        .all()
+    )
+    return {doc.id: doc for doc in documents}
+
+
+def _live_versions(doc_ids):
+    """
+    The freshness guard: {id: updated_at epoch} for documents that still
+    exist and are not deleted, from the primary key alone.
+    """
+    rows = db.session.query(Document.id, Document.updated_at).filter(
+        Document.id.in_(doc_ids), Document.is_deleted == False
+    )
+    return {
+        doc_id: updated_at.timestamp() if updated_at else 0
+        for doc_id, updated_at in rows
+    }
+
+
+def documents_from_index(hits):
+    """
+    Builds result cards from the fields stored with each hit. Hits whose
+    document was deleted are dropped; hits older than the database row, or
+    without stored fields, are hydrated from the database instead.
+    Returns {id: card}.
+    """
+    doc_ids = [hit["id"] for hit in hits]
+    if not doc_ids:
+        return {}
+    live = _live_versions(doc_ids)
+    categories = _load_categories()
+    tags = {t.id: t for t in Tag.query.all()}
+
+    cards = {}
+    stale = []
+    for hit in hits:
+        fields = hit.get("document")
+        if hit["id"] not in live:
+            continue
+        if not fields or (fields.get("updated_at") or 0) < live[hit["id"]]:
+            stale.append(hit["id"])
+            continue
+        cards[hit["id"]] = IndexedDocument(hit["id"], fields, categories, tags)
+    cards.update(hydrate_documents(stale))
+    return cards
@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta
+from flask import current_app, g, has_request_context
+from sqlalchemy import insert
+from sqlalchemy.orm import joinedload, selectinload
+from meilisearch_python_sdk.errors import MeilisearchApiError
+from app.extensions import db
+from app.models import Document, SearchOutbox
+from app.search.services import (
+    apply_index_settings,
+    document_to_index,
+    get_meili_client,
+    get_meili_index,
+)
+from app.search.cache import bump_index_version
+
+
+def queue_index_sync(*documents):
+    """
+    Records that the given documents must be re-sent to the search index. The
+    caller owns the transaction, so the outbox rows commit with the change.
+    """
+    if any(doc.id is None for doc in documents):
+        db.session.flush()
+    queue_index_sync_ids([doc.id for doc in documents])
+
+
+def queue_index_sync_ids(document_ids):
+    document_ids = list(document_ids)
+    if not document_ids:
+        return
+    db.session.execute(
+        insert(SearchOutbox), [{"document_id": doc_id} for doc_id in document_ids]
+    )
+    if has_request_context():
+        g.index_sync_queued = True
+
+
+_settings_checked = False
+
+
+def ensure_index_settings():
+    """
+    Applies INDEX_SETTINGS once per process, before the first batch is sent.
+    """
+    global _settings_checked
+    if _settings_checked:
+        return
+    try:
+        task = apply_index_settings()
+    except Exception as e:
+        current_app.logger.error(f"Could not apply search index settings: {e}")
+        return
+    _settings_checked = True
+    if task is not None:
+        current_app.logger.info(f"Updating search index settings (task {task.task_uid})")
+
+
+def _backoff(attempts):
+    base = current_app.config["SEARCH_SYNC_RETRY_BACKOFF"]
+    return min(base * 2 ** (attempts - 1), current_app.config["SEARCH_SYNC_MAX_BACKOFF"])
+
+
+def _retry_later(rows, error):
+    now = datetime.utcnow()
+    for row in rows:
+        row.attempts = (row.attempts or 0) + 1
+        row.status = "pending"
+        row.task_uid = None
+        row.last_error = error
+        row.run_after = now + timedelta(seconds=_backoff(row.attempts))
+
+
+def confirm_sent():
+    """
+    Checks the Meilisearch tasks of sent batches. Rows whose task succeeded are
+    marked done and kept for SEARCH_OUTBOX_RETENTION seconds, so a reindex can
+    replay them; rows whose task failed go back to pending with a backoff.
+    """
+    task_uids = [
+        uid
+        for (uid,) in db.session.query(SearchOutbox.task_uid)
+        .filter(SearchOutbox.status == "sent")
+        .distinct()
+    ]
+    if not task_uids:
+        return 0
+
+    client = get_meili_client()
+    confirmed = 0
+    for task_uid in task_uids:
+        rows = SearchOutbox.query.filter_by(status="sent", task_uid=task_uid)
+        try:
+            task = client.get_task(task_uid)
+        except MeilisearchApiError as e:
+            # Pruned from the task queue before we looked: send again to be safe
+            _retry_later(rows.all(), f"task {task_uid}: {e}")
+            continue
+        except Exception as e:
+            current_app.logger.error(f"Could not check search index task {task_uid}: {e}")
+            break
+
+        if task.status == "succeeded":
+            confirmed += rows.update({"status": "done"}, synchronize_session=False)
+        elif task.status in ("failed", "canceled"):
+            error = task.error.get("message") if task.error else task.status
+            current_app.logger.error(f"Search index task {task_uid} {task.status}: {error}")
+            _retry_later(rows.all(), f"task {task_uid}: {error}")
+
+    expired = datetime.utcnow() - timedelta(
+        seconds=current_app.config["SEARCH_OUTBOX_RETENTION"]
+    )
+    SearchOutbox.query.filter(
+        SearchOutbox.status == "done", SearchOutbox.created_at < expired
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    # Results cached while Meilisearch was still applying the batch are stale
+    if confirmed:
+        bump_index_version()
+    return confirmed
+
+
+def drain_outbox(batch_size=None):
+    """
+    Sends one batch of pending changes. Repeated changes to a document collapse
+    into a single upsert or delete built from its current state, so an editor
+    saving ten times costs one payload. Returns the number of documents sent.
+    """
+    batch_size = batch_size or current_app.config["SEARCH_SYNC_BATCH_SIZE"]
+    rows = (
+        SearchOutbox.query.filter(
+            SearchOutbox.status == "pending", SearchOutbox.run_after <= datetime.utcnow()
+        )
+        .order_by(SearchOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    document_ids = {row.document_id for row in rows}
+    documents = (
+        Document.query.options(
+            joinedload(Document.category),
+            joinedload(Document.correspondent),
+            joinedload(Document.academic_period),
+            selectinload(Document.tags),
+        )
+        .filter(Document.id.in_(document_ids), Document.is_deleted == False)
+        .all()
+    )
+    upsert_ids = {doc.id for doc in documents}
+    delete_ids = document_ids - upsert_ids
+
+    try:
+        index = get_meili_index()
+        tasks = {}
+        if documents:
+            task = index.add_documents([document_to_index(doc) for doc in documents])
+            tasks.update((doc_id, task.task_uid) for doc_id in upsert_ids)
+        if delete_ids:
+            task = index.delete_documents([str(doc_id) for doc_id in delete_ids])
+            tasks.update((doc_id, task.task_uid) for doc_id in delete_ids)
+    except Exception as e:
+        current_app.logger.error(
+            f"Search index sync failed for {len(document_ids)} documents: {e}"
+        )
+        _retry_later(rows, str(e))
+        db.session.commit()
+        return 0
+
+    for row in rows:
+        row.status = "sent"
+        row.task_uid = tasks[row.document_id]
+    db.session.commit()
+    bump_index_version()
+    return len(document_ids)
+
+
+def sync_search_index(max_batches=None):
+    """
+    Confirms earlier batches and then drains pending changes. Returns the number
+    of documents sent.
+    """
+    ensure_index_settings()
+    confirm_sent()
+    sent = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        count = drain_outbox()
+        if not count:
+            break
+        sent += count
+        batches += 1
+    return sent
@@ -1,69 +1,94 @@
-from flask import render_template, request
+from flask import current_app, g, render_template, request
 from flask_login import login_required
 from sqlalchemy import or_
-from app.models import Document, Category, AcademicPeriod, Tag
-from app.search.services import search_documents
+from app.models import Document, Category, AcademicPeriod, Tag, Correspondent
+from app.search.services import facet_counts
+from app.search.backends import (
+    SORTS,
+    filters_from_args,
+    search as search_backend,
+    sort_from_args,
+)
+from app.search.outbox import sync_search_index
+from app.search.cache import search_cache_key, get_cached_search, cache_search
+from app.search.hydration import documents_from_index, hydrate_documents
 from . import search
 
+# Highlighted fields kept in cached result pages
+HIGHLIGHT_FIELDS = ("title", "content", "description")
+
+
+@search.after_app_request
+def sync_index_eagerly(response):
+    # Without a worker (INGEST_EAGER) nothing else drains the outbox
+    if g.get("index_sync_queued") and current_app.config["INGEST_EAGER"]:
+        try:
+            sync_search_index()
+        except Exception as e:
+            current_app.logger.error(f"Search index sync failed: {e}")
+    return response
+
 
 @search.route("/")
 @login_required
 def index():
     query = request.args.get("q", "")
-    category_id = request.args.get("category", type=int)
-    period_id = request.args.get("period", type=int)
-    tag_id = request.args.get("tag", type=int)
-    date_from = request.args.get("date_from")
-    date_to = request.args.get("date_to")
+    filters = filters_from_args(request.args)
+    sort = sort_from_args(request.args)
+
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = current_app.config["SEARCH_RESULTS_PER_PAGE"]
 
     results = []
     total_count = 0
     search_performed = False
     highlights = {}
+    facets = {}
+    cache_status = None
+    backend = None
 
-    if query or category_id or period_id or tag_id or date_from or date_to:
+    if query or any(filters.values()):
         search_performed = True
 
-        # Build Meilisearch filters
-        ms_filters = []
-        if category_id:
-            cat = Category.query.get(category_id)
-            if cat:
-                ms_filters.append(f"category = '{cat.name}'")
-        if period_id:
-            per = AcademicPeriod.query.get(period_id)
-            if per:
-                ms_filters.append(f"period = '{per.name}'")
-        if tag_id:
-            tag = Tag.query.get(tag_id)
-            if tag:
-                ms_filters.append(f"tags = '{tag.name}'")
-
-        # Note: date filtering in Meilisearch would require timestamps
-        # For now, let's focus on the main query
-
-        filter_str = " AND ".join(ms_filters) if ms_filters else None
-
-        ms_results = search_documents(query, filters=filter_str)
+        cache_key = search_cache_key(query, filters, page, sort)
+        result = get_cached_search(cache_key)
+        if cache_key:
+            cache_status = "hit" if result else "miss"
 
-        if ms_results:
-            total_count = ms_results.total_hits
-            doc_ids = [hit["id"] for hit in ms_results.hits]
+        if result is None:
+            # Filters and sort run in the engine, which returns just this page
+            result = search_backend(
+                query,
+                filters,
+                limit=per_page,
+                offset=(page - 1) * per_page,
+                highlight_fields=HIGHLIGHT_FIELDS,
+                sort=sort,
+            )
+            # Database fallback results must not outlive a Meilisearch outage
+            if result["backend"] == "meilisearch":
+                cache_search(cache_key, result)
+            else:
+                cache_status = None
 
-            # Fetch documents from DB to ensure they exist and get all data
-            # Keep Meilisearch order
-            if doc_ids:
-                db_docs = Document.query.filter(
-                    Document.id.in_(doc_ids), Document.is_deleted == False
-                ).all()
-                doc_map = {doc.id: doc for doc in db_docs}
+        if result:
+            backend = result.get("backend")
+            total_count = result["total"]
+            if result.get("facets") is not None:
+                facets = facet_counts(result["facets"])
+            if (
+                current_app.config["SEARCH_RENDER_FROM_INDEX"]
+                and result.get("backend") == "meilisearch"
+            ):
+                doc_map = documents_from_index(result["hits"])
+            else:
+                doc_map = hydrate_documents([hit["id"] for hit in result["hits"]])
 
-                for hit in ms_results.hits:
-                    doc_id = int(hit["id"])
-                    if doc_id in doc_map:
-                        results.append(doc_map[doc_id])
-                        # Store highlights from _formatted
-                        highlights[doc_id] = hit.get("_formatted", {})
+            # Keep search order; hits deleted since indexing are skipped
+            for hit in result["hits"]:
+                if hit["id"] in doc_map:
+                    results.append(doc_map[hit["id"]])
+                    highlights[hit["id"]] = hit["_formatted"]
 
     categories = (
         Category.query.filter_by(is_active=True)
@@ -76,6 +101,7 @@ def index():
         .all()
     )
     tags = Tag.query.order_by(Tag.name).all()
+    correspondents = Correspondent.query.order_by(Correspondent.name).all()
 
     return render_template(
         "search/index.html",
@@ -86,5 +112,13 @@ def index():
         categories=categories,
         periods=periods,
         tags=tags,
+        correspondents=correspondents,
+        sorts=SORTS,
+        sort=sort,
         highlights=highlights,
+        facets=facets,
+        backend=backend,
+        page=page,
+        pages=max((total_count + per_page - 1) // per_page, 1),
+        cache_status=cache_status,
     )
@@ -1,82 +1,303 @@
+import os
+import atexit
+import threading
+import httpx
 import meilisearch_python_sdk
+from meilisearch_python_sdk.models.settings import MeilisearchSettings, Pagination
 from flask import current_app
 from app.models import Document
 
+_client = None
+_client_key = None
+_client_lock = threading.Lock()
 
-def get_meili_client():
-    return meilisearch_python_sdk.Client(
-        current_app.config["MEILI_HTTP_ADDR"], current_app.config["MEILI_MASTER_KEY"]
+# Highlight markers that cannot occur in extracted text; replaced by <mark>
+# tags after the snippet has been HTML-escaped
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+
+def _client_settings():
+    config = current_app.config
+    return (
+        config["MEILI_HTTP_ADDR"],
+        config["MEILI_MASTER_KEY"],
+        config["MEILI_TIMEOUT"],
+        config["MEILI_CONNECT_TIMEOUT"],
     )
 
 
+def _timeout(settings):
+    _, _, timeout, connect_timeout = settings
+    return httpx.Timeout(timeout, connect=connect_timeout)
+
+
+def get_meili_client():
+    """
+    Returns the process-wide Meilisearch client. It keeps its HTTP connections
+    alive between calls; a forked child builds its own instead of sharing sockets
+    with the parent.
+    """
+    global _client, _client_key
+    settings = _client_settings()
+    key = (os.getpid(), settings)
+    with _client_lock:
+        if _client is None or _client_key != key:
+            if _client is not None and _client_key[0] == os.getpid():
+                _client.http_client.close()
+            _client = meilisearch_python_sdk.Client(
+                settings[0], settings[1], timeout=_timeout(settings)
+            )
+            _client_key = key
+        return _client
+
+
+def close_meili_client():
+    global _client, _client_key
+    with _client_lock:
+        if _client is not None and _client_key[0] == os.getpid():
+            _client.http_client.close()
+        _client = None
+        _client_key = None
+
+
+atexit.register(close_meili_client)
+
+
 def get_meili_index():
     client = get_meili_client()
     return client.index(current_app.config["MEILI_INDEX_NAME"])
 
 
-def index_document(document):
+# Index settings are managed here and applied by the worker on startup and by
+# scripts/reindex.py; never edit them on the Meilisearch instance by hand.
+INDEX_SETTINGS = {
+    "searchable_attributes": [
+        "title",
+        "original_filename",
+        "tags",
+        "category",
+        "correspondent",
+        "description",
+        "content",
+    ],
+    "filterable_attributes": [
+        "id",
+        "category_ids",
+        "period_id",
+        "tag_ids",
+        "correspondent_id",
+        "year",
+        "month",
+        "uploaded_at",
+        "mime_type",
+    ],
+    "sortable_attributes": ["uploaded_at", "title", "year"],
+}
+
+# Stored fields a result card is rendered from (see app/search/hydration.py);
+# searches retrieve only these, never the extracted text
+CARD_FIELDS = (
+    "title",
+    "original_filename",
+    "category_id",
+    "tag_ids",
+    "uploaded_at",
+    "updated_at",
+    "mime_type",
+    "checksum",
+)
+
+# Request parameter -> index attribute for the filters shown as facets
+FACETS = {
+    "category": "category_ids",
+    "period": "period_id",
+    "tag": "tag_ids",
+    "correspondent": "correspondent_id",
+}
+
+
+def category_ancestry(category):
     """
-    Indexes a single document in Meilisearch.
+    Ids of a category and all of its parents, so filtering on a parent
+    category also matches documents filed under its subcategories.
     """
-    try:
-        index = get_meili_index()
+    ids = []
+    while category is not None and category.id not in ids:
+        ids.append(category.id)
+        category = category.parent
+    return ids
 
-        # Prepare document for indexing
-        doc_data = {
-            "id": document.id,
-            "title": document.title,
-            "content": document.content_text,
-            "description": document.description,
-            "original_filename": document.original_filename,
-            "category": document.category.name if document.category else None,
-            "period": document.academic_period.name
-            if document.academic_period
-            else None,
-            "year": document.year,
-            "month": document.month,
-            "tags": [tag.name for tag in document.tags],
-            "uploaded_at": int(document.uploaded_at.timestamp()),
-            "mime_type": document.mime_type,
-        }
 
-        index.add_documents([doc_data])
-    except Exception as e:
-        current_app.logger.error(f"Failed to index document {document.id}: {str(e)}")
+def document_to_index(document):
+    """
+    Builds the Meilisearch payload for a document.
+    """
+    return {
+        "id": document.id,
+        "title": document.title,
+        "content": document.content_text,
+        "description": document.description,
+        "original_filename": document.original_filename,
+        "category": document.category.name if document.category else None,
+        "category_id": document.category_id,
+        "category_ids": category_ancestry(document.category),
+        "period": document.academic_period.name if document.academic_period else None,
+        "period_id": document.academic_period_id,
+        "correspondent": document.correspondent.name if document.correspondent else None,
+        "correspondent_id": document.correspondent_id,
+        "year": document.year,
+        "month": document.month,
+        "tags": [tag.name for tag in document.tags],
+        "tag_ids": [tag.id for tag in document.tags],
+        "uploaded_at": int(document.uploaded_at.timestamp()),
+        # Full precision: compared with the row to spot stale hits
+        "updated_at": (
+            document.updated_at.timestamp() if document.updated_at else None
+        ),
+        "mime_type": document.mime_type,
+        "checksum": document.checksum,
+    }
+
+
+def _settings_differ(current):
+    for field, wanted in INDEX_SETTINGS.items():
+        value = getattr(current, field) or []
+        if field == "searchable_attributes":
+            if list(value) != wanted:
+                return True
+        elif set(value) != set(wanted):
+            return True
+    pagination = current.pagination
+    return (
+        pagination is None
+        or pagination.max_total_hits != current_app.config["SEARCH_MAX_TOTAL_HITS"]
+    )
 
 
-def delete_document_from_index(document_id):
+def apply_index_settings(index=None):
     """
-    Removes a document from the Meilisearch index.
+    Brings the index settings in line with INDEX_SETTINGS and
+    SEARCH_MAX_TOTAL_HITS. Returns the settings task, or None when nothing
+    had to change.
     """
-    try:
-        index = get_meili_index()
-        index.delete_document(str(document_id))
-    except Exception as e:
-        current_app.logger.error(
-            f"Failed to delete document {document_id} from index: {str(e)}"
+    index = index or get_meili_client().get_or_create_index(
+        current_app.config["MEILI_INDEX_NAME"], primary_key="id"
+    )
+    if not _settings_differ(index.get_settings()):
+        return None
+    return index.update_settings(
+        MeilisearchSettings(
+            **INDEX_SETTINGS,
+            pagination=Pagination(
+                max_total_hits=current_app.config["SEARCH_MAX_TOTAL_HITS"]
+            ),
         )
+    )
 
 
-def search_documents(query, filters=None, limit=20, offset=0):
+def build_filters(
+    category_id=None,
+    period_id=None,
+    tag_id=None,
+    correspondent_id=None,
+    uploaded_from=None,
+    uploaded_before=None,
+    year=None,
+    month=None,
+):
     """
-    Searches documents in Meilisearch.
+    Turns id, date and year/month filters into Meilisearch filter expressions.
+    Every value is an integer by the time it is formatted, so nothing
+    user-supplied is ever quoted into the expression. The upload range is
+    half-open: uploaded_from <= uploaded_at < uploaded_before.
     """
-    try:
-        index = get_meili_index()
+    values = {
+        "category": category_id,
+        "period": period_id,
+        "tag": tag_id,
+        "correspondent": correspondent_id,
+    }
+    filters = [
+        f"{FACETS[name]} = {int(value)}" for name, value in values.items() if value
+    ]
+    # uploaded_at is indexed as an epoch from the same naive datetimes
+    if uploaded_from:
+        filters.append(f"uploaded_at >= {int(uploaded_from.timestamp())}")
+    if uploaded_before:
+        filters.append(f"uploaded_at < {int(uploaded_before.timestamp())}")
+    if year:
+        filters.append(f"year = {int(year)}")
+    if month:
+        filters.append(f"month = {int(month)}")
+    return filters
+
 
-        search_params = {
-            "limit": limit,
-            "offset": offset,
-            "attributesToHighlight": ["content", "title", "description"],
-            "attributesToSnippet": ["content:50"],
-            "highlightPreTag": "<mark>",
-            "highlightPostTag": "</mark>",
+def facet_counts(facet_distribution):
+    """
+    Maps Meilisearch's facet distribution back to request parameter names with
+    integer ids, e.g. {"category": {3: 12}}.
+    """
+    facet_distribution = facet_distribution or {}
+    return {
+        name: {
+            int(value): count
+            for value, count in facet_distribution.get(attribute, {}).items()
         }
+        for name, attribute in FACETS.items()
+    }
+
 
-        if filters:
-            search_params["filter"] = filters
+def search_documents(query, filters=None, limit=20, offset=0, facets=None, sort=None):
+    """
+    Searches documents in Meilisearch. Pass facets (index attributes) to get
+    their counts back in the same request, and sort (e.g. ["uploaded_at:desc"])
+    to order by an attribute instead of relevance. Hits carry the card fields
+    and highlighted snippets cropped to SEARCH_CROP_LENGTH words, not the
+    extracted text itself. Matches are wrapped in MARK_START/MARK_END, not
+    HTML, since the hit text is not escaped.
+    """
+    try:
+        index = get_meili_index()
 
-        return index.search(query, search_params)
+        return index.search(
+            query,
+            limit=limit,
+            offset=offset,
+            filter=filters or None,
+            facets=facets,
+            sort=sort,
+            attributes_to_retrieve=["id", *CARD_FIELDS],
+            attributes_to_highlight=["content", "title", "description"],
+            attributes_to_crop=["content", "description"],
+            crop_length=current_app.config["SEARCH_CROP_LENGTH"],
+            highlight_pre_tag=MARK_START,
+            highlight_post_tag=MARK_END,
+        )
     except Exception as e:
         current_app.logger.error(f"Search failed: {str(e)}")
         return None
+
+
+def highlight_content(document_id, query, pre_tag, post_tag):
+    """
+    The full extracted text of one document with every match of query
+    highlighted, for the detail view. Returns None when Meilisearch is
+    unavailable or the document is not indexed.
+    """
+    try:
+        results = get_meili_index().search(
+            query,
+            limit=1,
+            filter=f"id = {int(document_id)}",
+            attributes_to_retrieve=["id"],
+            attributes_to_highlight=["content"],
+            highlight_pre_tag=pre_tag,
+            highlight_post_tag=post_tag,
+        )
+    except Exception as e:
+        current_app.logger.error(f"Highlighting document {document_id} failed: {str(e)}")
+        return None
+    if not results.hits:
+        return None
+    return results.hits[0].get("_formatted", {}).get("content")
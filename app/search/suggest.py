@@ -0,0 +1,340 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import threading
+from array import array
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import Document, SearchOutbox, Tag, Category, Correspondent
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Small vocabularies rank above document titles for the same prefix
+KIND_ORDER = {"tag": 0, "category": 1, "correspondent": 2, "document": 3}
+
+# Document titles matched, and posting entries read, per lookup, so a
+# one-letter prefix or a word in every title stays cheap. Tags, categories and
+# correspondents are few and always scanned in full.
+MAX_CANDIDATES = 500
+MAX_SCANNED = 2000
+
+
+def _words(text):
+    return WORD_PATTERN.findall((text or "").casefold())
+
+
+class PrefixIndex:
+    """
+    Word-prefix lookup over short labels. Each distinct word is stored once in a
+    sorted list with an array of entry numbers, kept apart for document titles
+    and for the vocabularies; updates append a new entry and tombstone the old
+    one, and a rebuild compacts them.
+    """
+
+    def __init__(self):
+        self.words = []
+        self.postings = {}
+        self.vocabulary_words = []
+        self.vocabulary_postings = {}
+        self.entries = []
+        self.live = {}
+
+    def add(self, kind, item_id, label):
+        key = (kind, item_id)
+        current = self.live.get(key)
+        if current is not None:
+            if self.entries[current][2] == label:
+                return
+            self.remove(kind, item_id)
+        if not label:
+            return
+
+        words = _words(label)
+        entry = len(self.entries)
+        self.entries.append((kind, item_id, label, " ".join(words)))
+        self.live[key] = entry
+        if kind == "document":
+            sorted_words, postings = self.words, self.postings
+        else:
+            sorted_words, postings = self.vocabulary_words, self.vocabulary_postings
+        for word in set(words):
+            posting = postings.get(word)
+            if posting is None:
+                posting = postings[word] = array("I")
+                bisect.insort(sorted_words, word)
+            posting.append(entry)
+
+    def remove(self, kind, item_id):
+        entry = self.live.pop((kind, item_id), None)
+        if entry is not None:
+            self.entries[entry] = None
+
+    def items(self, kind):
+        return {key[1] for key in self.live if key[0] == kind}
+
+    def _match(self, entry, complete):
+        item = self.entries[entry]
+        if item is None:
+            return None
+        # Earlier words must match whole-word prefixes too
+        if complete:
+            padded = f" {item[3]}"
+            if not all(t in padded for t in complete):
+                return None
+        return item
+
+    @staticmethod
+    def _prefix_words(words, prefix):
+        position = bisect.bisect_left(words, prefix)
+        while position < len(words) and words[position].startswith(prefix):
+            yield words[position]
+            position += 1
+
+    def search(self, query, limit=10):
+        terms = _words(query)
+        if not terms:
+            return []
+        *complete, prefix = terms
+        complete = [f" {t}" for t in complete]
+
+        found = {}
+        for word in self._prefix_words(self.vocabulary_words, prefix):
+            for entry in self.vocabulary_postings[word]:
+                found[entry] = self._match(entry, complete)
+
+        scanned = documents = 0
+        for word in self._prefix_words(self.words, prefix):
+            # Newest entries first: tombstones pile up behind their replacements
+            for entry in reversed(self.postings[word]):
+                if documents >= MAX_CANDIDATES or scanned >= MAX_SCANNED:
+                    break
+                scanned += 1
+                if entry in found:
+                    continue
+                item = found[entry] = self._match(entry, complete)
+                if item is not None:
+                    documents += 1
+            if documents >= MAX_CANDIDATES or scanned >= MAX_SCANNED:
+                break
+
+        normalized = " ".join(terms)
+        matches = [
+            (not folded.startswith(normalized), KIND_ORDER[kind], len(label), label, kind, item_id)
+            for kind, item_id, label, folded in filter(None, found.values())
+        ]
+        return [
+            {"type": kind, "id": item_id, "label": label}
+            for _, _, _, label, kind, item_id in heapq.nsmallest(limit, matches)
+        ]
+
+
+_index = None
+_index_key = None
+_thread = None
+_vocabularies_stale = True
+_lock = threading.Lock()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_change(session, flush_context):
+    # Vocabulary edits made in this process show up on the next refresh
+    global _vocabularies_stale
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Tag, Correspondent, Category)):
+            _vocabularies_stale = True
+            return
+
+
+def _category_paths():
+    """
+    Full paths of the active categories from a single query; parents are
+    resolved in memory instead of one lazy load per level.
+    """
+    categories = {
+        c.id: (c.name, c.parent_id, c.is_active)
+        for c in db.session.query(
+            Category.id, Category.name, Category.parent_id, Category.is_active
+        )
+    }
+    paths = {}
+
+    def path(category_id):
+        if category_id not in paths:
+            name, parent_id, _ = categories[category_id]
+            parent = parent_id in categories and path(parent_id)
+            paths[category_id] = f"{parent} / {name}" if parent else name
+        return paths[category_id]
+
+    return {
+        category_id: path(category_id)
+        for category_id, (_, _, is_active) in categories.items()
+        if is_active
+    }
+
+
+def _load_vocabularies():
+    return {
+        "tag": dict(db.session.query(Tag.id, Tag.name)),
+        "category": _category_paths(),
+        "correspondent": dict(db.session.query(Correspondent.id, Correspondent.name)),
+    }
+
+
+def _apply_vocabularies(index, vocabularies):
+    # Anything renamed or removed since the last pass is replaced or dropped
+    for kind, labels in vocabularies.items():
+        for item_id in index.items(kind) - labels.keys():
+            index.remove(kind, item_id)
+        for item_id, label in labels.items():
+            index.add(kind, item_id, label)
+
+
+def _changed_documents(since=None):
+    """
+    (id, title, is_deleted) rows changed since the watermark (all of them
+    without one) and the new watermark.
+    """
+    query = db.session.query(
+        Document.id, Document.title, Document.is_deleted, Document.updated_at
+    )
+    if since is not None:
+        # >= so rows sharing the watermark's timestamp are not missed
+        query = query.filter(Document.updated_at >= since)
+    rows = []
+    latest = since
+    for doc_id, title, is_deleted, updated_at in query.yield_per(5000):
+        rows.append((doc_id, title, is_deleted))
+        if updated_at and (latest is None or updated_at > latest):
+            latest = updated_at
+    return rows, latest
+
+
+def _apply_documents(index, rows):
+    for doc_id, title, is_deleted in rows:
+        if is_deleted:
+            index.remove("document", doc_id)
+        else:
+            index.add("document", doc_id, title)
+
+
+def _outbox_watermark():
+    return db.session.query(func.max(SearchOutbox.id)).scalar() or 0
+
+
+def _purged_documents(index, since):
+    """
+    Ids in the index whose row is gone, and the new outbox watermark. Purges
+    leave nothing for the updated_at watermark to find, but like every index
+    change they write a search outbox row.
+    """
+    touched = set()
+    for outbox_id, doc_id in db.session.query(
+        SearchOutbox.id, SearchOutbox.document_id
+    ).filter(SearchOutbox.id > since):
+        touched.add(doc_id)
+        since = max(since, outbox_id)
+    candidates = {doc_id for doc_id in touched if ("document", doc_id) in index.live}
+    if not candidates:
+        return set(), since
+    remaining = {
+        doc_id
+        for (doc_id,) in db.session.query(Document.id).filter(
+            Document.id.in_(candidates)
+        )
+    }
+    return candidates - remaining, since
+
+
+def _build():
+    index = PrefixIndex()
+    started = datetime.utcnow()
+    outbox_seen = _outbox_watermark()
+    _apply_vocabularies(index, _load_vocabularies())
+    rows, _ = _changed_documents()
+    _apply_documents(index, rows)
+    return index, started, outbox_seen
+
+
+def _maintain(app, key):
+    """
+    Background loop that keeps the index current. Database reads happen
+    outside the lock; full rebuilds are swapped in whole and incremental
+    changes are applied under the lock in memory only, so lookups never
+    wait on a query.
+    """
+    global _index, _vocabularies_stale
+    config = app.config
+    built_at = vocabularies_at = 0.0
+    seen = outbox_seen = None
+    while _index_key == key:
+        with app.app_context():
+            try:
+                now = time.monotonic()
+                if _index is None or now - built_at > config["SUGGEST_REBUILD_INTERVAL"]:
+                    # A full rebuild also compacts tombstones
+                    _vocabularies_stale = False
+                    index, seen, outbox_seen = _build()
+                    with _lock:
+                        _index = index
+                    built_at = vocabularies_at = now
+                else:
+                    vocabularies = None
+                    if (
+                        _vocabularies_stale
+                        or now - vocabularies_at > config["SUGGEST_VOCABULARY_INTERVAL"]
+                    ):
+                        _vocabularies_stale = False
+                        vocabularies = _load_vocabularies()
+                        vocabularies_at = now
+                    rows, seen = _changed_documents(seen)
+                    with _lock:
+                        if vocabularies is not None:
+                            _apply_vocabularies(_index, vocabularies)
+                        _apply_documents(_index, rows)
+                    purged, outbox_seen = _purged_documents(_index, outbox_seen)
+                    with _lock:
+                        for doc_id in purged:
+                            _index.remove("document", doc_id)
+            except Exception as e:
+                app.logger.error(f"Suggestion index refresh failed: {e}")
+            finally:
+                db.session.remove()
+        time.sleep(config["SUGGEST_REFRESH_INTERVAL"])
+
+
+def _ensure_started():
+    global _index, _index_key, _thread
+    key = (os.getpid(), current_app.config["SQLALCHEMY_DATABASE_URI"])
+    if _index_key == key:
+        return
+    with _lock:
+        if _index_key == key:
+            return
+        # First use in this process (or after a fork, or for another app)
+        _index, _index_key = None, key
+        _thread = threading.Thread(
+            target=_maintain,
+            args=(current_app._get_current_object(), key),
+            name="suggest-index",
+            daemon=True,
+        )
+        _thread.start()
+
+
+def suggest(query, limit=10):
+    """
+    Prefix completions for titles, tags, categories and correspondents from
+    the in-process index, which a background thread catches up with the
+    database every SUGGEST_REFRESH_INTERVAL seconds. Empty until the first
+    build finishes.
+    """
+    _ensure_started()
+    with _lock:
+        if _index is None:
+            return []
+        return _index.search(query, limit)
@@ -0,0 +1,24 @@
+import time
+import argparse
+from app import create_app
+from app.documents.related import rebuild_related
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild TF-IDF vectors and related-document lists."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=200, help="Documents per transaction."
+    )
+    args = parser.parse_args()
+
+    app = create_app("default")
+    with app.app_context():
+        started = time.time()
+        total = rebuild_related(batch_size=args.batch_size)
+        print(f"Rebuilt related documents for {total} document(s) in {time.time() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
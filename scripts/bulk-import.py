@@ -0,0 +1,353 @@
+import os
+import re
+import csv
+import json
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app
+from app.extensions import db
+from app.models import Document, Category, AcademicPeriod, Tag, AdminUser
+from app.documents.services import extract_text_content, store_upload
+from app.documents.extraction_pool import ExtractionError, extract_text_isolated
+from app.documents.jobs import enqueue_ingest, run_job_inline
+from app.search.outbox import sync_search_index
+
+PERIOD_PATTERN = re.compile(r"^(\d{4})-(\d{4})[ /](\w+)$")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Import a directory tree or CSV manifest into the archive."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory to walk recursively.")
+    source.add_argument(
+        "--manifest",
+        help="CSV with columns path, category, period and optional tags, title, description.",
+    )
+    parser.add_argument("--category", help="Category slug or name for every file.")
+    parser.add_argument("--period", help='Academic period, e.g. "2024-2025 Fall".')
+    parser.add_argument("--tags", default="", help="Comma separated tags for every file.")
+    parser.add_argument("--user", help="Username recorded as uploader (default: first admin).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--checkpoint",
+        default="bulk-import.checkpoint",
+        help="File recording imported source paths, used to resume.",
+    )
+    return parser.parse_args()
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def append_checkpoint(path, sources):
+    with open(path, "a", encoding="utf-8") as f:
+        for source in sources:
+            f.write(source + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def split_tags(value):
+    return [t.strip() for t in re.split(r"[,;]", value or "") if t.strip()]
+
+
+def iter_directory(root, category=None, period=None, tags=""):
+    """
+    Yields one entry per file. Without --category/--period, the archive's own
+    layout (<years>/<semester>/<category-slug>/<file>) is used.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.startswith("."):
+                continue
+            path = os.path.join(dirpath, filename)
+            parts = os.path.relpath(path, root).split(os.sep)
+            entry = {
+                "path": os.path.abspath(path),
+                "category": category,
+                "period": period,
+                "tags": split_tags(tags),
+            }
+            if len(parts) >= 4:
+                entry["period"] = entry["period"] or f"{parts[-4]}/{parts[-3]}"
+                entry["category"] = entry["category"] or parts[-2]
+            yield entry
+
+
+def iter_manifest(path, category=None, period=None, tags=""):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            file_path = row["path"]
+            if not os.path.isabs(file_path):
+                file_path = os.path.join(base, file_path)
+            yield {
+                "path": os.path.abspath(file_path),
+                "category": row.get("category") or category,
+                "period": row.get("period") or period,
+                "tags": split_tags(row.get("tags")) or split_tags(tags),
+                "title": row.get("title") or None,
+                "description": row.get("description") or None,
+            }
+
+
+class Lookups:
+    """
+    Resolves categories, periods and tags once per distinct value.
+    """
+
+    def __init__(self):
+        self.categories = {}
+        self.periods = {}
+        self.tags = {t.name: t for t in Tag.query.all()}
+
+    def category(self, value):
+        if not value:
+            return None
+        if value not in self.categories:
+            self.categories[value] = Category.query.filter(
+                (Category.slug == value) | (db.func.lower(Category.name) == value.lower())
+            ).first()
+        return self.categories[value]
+
+    def period(self, value):
+        if not value:
+            return None
+        if value not in self.periods:
+            match = PERIOD_PATTERN.match(value.strip())
+            self.periods[value] = (
+                AcademicPeriod.query.filter_by(
+                    year_start=int(match.group(1)),
+                    year_end=int(match.group(2)),
+                    semester=match.group(3),
+                ).first()
+                if match
+                else None
+            )
+        return self.periods[value]
+
+    def tag(self, name):
+        if name not in self.tags:
+            tag = Tag(name=name)
+            db.session.add(tag)
+            self.tags[name] = tag
+        return self.tags[name]
+
+
+def prepare_file(app, entry, isolated):
+    """
+    Copies a source file into the archive and extracts its text. Runs in a worker
+    thread; extraction itself happens in the isolated extraction processes.
+    """
+    with app.app_context():
+        try:
+            with open(entry["path"], "rb") as f:
+                stored = store_upload(f, entry["file_path"])
+
+            error = None
+            if isolated:
+                try:
+                    text = extract_text_isolated(
+                        entry["file_path"], stored["mime_type"], checksum=stored["checksum"]
+                    )
+                except ExtractionError as e:
+                    text, error = None, f"extract: {e}"
+            else:
+                text = extract_text_content(
+                    entry["file_path"], stored["mime_type"], checksum=stored["checksum"]
+                )
+        except Exception:
+            _remove_copy(entry["file_path"])
+            raise
+        return stored, text, error
+
+
+def _remove_copy(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def import_batch(app, executor, batch, lookups, uploader, seen_blobs, isolated):
+    """
+    Imports one batch in a single transaction and returns the source paths it
+    committed. Files skipped or failed here are left for a later run.
+    """
+    upload_folder = app.config["UPLOAD_FOLDER"]
+
+    # The checkpoint is written after the commit; a crash in between leaves
+    # these already in the database
+    imported = {
+        path
+        for (path,) in db.session.query(Document.source_path).filter(
+            Document.source_path.in_([e["path"] for e in batch])
+        )
+    }
+
+    ready = []
+    for entry in batch:
+        if entry["path"] in imported:
+            continue
+        category = lookups.category(entry["category"])
+        period = lookups.period(entry["period"])
+        if not category or not period:
+            print(f"Skipping {entry['path']}: unknown category/period")
+            continue
+        ext = os.path.splitext(entry["path"])[1]
+        entry["stored_filename"] = f"{uuid.uuid4()}{ext}"
+        entry["file_path"] = os.path.join(
+            upload_folder, period.folder_name, category.slug, entry["stored_filename"]
+        )
+        entry["category_id"], entry["period_id"] = category.id, period.id
+        ready.append(entry)
+
+    futures = [executor.submit(prepare_file, app, e, isolated) for e in ready]
+
+    documents = []
+    errors = []
+    copies = []
+    for entry, future in zip(ready, futures):
+        try:
+            stored, text, error = future.result()
+        except Exception as e:
+            print(f"Skipping {entry['path']}: {e}")
+            continue
+
+        # Identical bytes already archived (earlier run or earlier in this one)
+        blob = seen_blobs.get(stored["checksum"])
+        if blob is None:
+            existing = Document.query.filter_by(
+                checksum=stored["checksum"], file_size=stored["file_size"]
+            ).first()
+            if existing and os.path.exists(existing.file_path):
+                blob = (existing.file_path, existing.stored_filename)
+        if blob:
+            os.remove(entry["file_path"])
+            entry["file_path"], entry["stored_filename"] = blob
+        else:
+            copies.append((stored["checksum"], entry["file_path"]))
+            seen_blobs[stored["checksum"]] = (entry["file_path"], entry["stored_filename"])
+
+        original_filename = os.path.basename(entry["path"])
+        doc = Document(
+            title=entry.get("title") or os.path.splitext(original_filename)[0],
+            original_filename=original_filename,
+            stored_filename=entry["stored_filename"],
+            file_path=entry["file_path"],
+            file_size=stored["file_size"],
+            mime_type=stored["mime_type"],
+            checksum=stored["checksum"],
+            content_text=text,
+            description=entry.get("description"),
+            category_id=entry["category_id"],
+            academic_period_id=entry["period_id"],
+            uploaded_by=uploader.id,
+            source_path=entry["path"],
+            metadata_json=json.dumps(
+                {
+                    "original_filename": original_filename,
+                    "mime_type": stored["mime_type"],
+                    "source_path": entry["path"],
+                }
+            ),
+        )
+        for name in entry["tags"]:
+            doc.tags.append(lookups.tag(name))
+        documents.append(doc)
+        errors.append(error)
+
+    jobs = []
+    try:
+        db.session.add_all(documents)
+        # Text is already extracted; the remaining stages are the upload's
+        for doc, error in zip(documents, errors):
+            jobs.append(enqueue_ingest(doc, stage="match"))
+            doc.processing_error = error
+        db.session.commit()
+    except BaseException:
+        # Nothing in this batch was recorded: drop the files it copied
+        db.session.rollback()
+        for checksum, path in copies:
+            seen_blobs.pop(checksum, None)
+            _remove_copy(path)
+        raise
+
+    if app.config["INGEST_EAGER"]:
+        for job in jobs:
+            run_job_inline(job)
+        try:
+            sync_search_index()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Search index sync deferred to the worker: {e}")
+    return [doc.source_path for doc in documents]
+
+
+def bulk_import(args):
+    app = create_app("default")
+    app.config["EXTRACTION_POOL_SIZE"] = args.workers
+
+    with app.app_context():
+        uploader = (
+            AdminUser.query.filter_by(username=args.user).first()
+            if args.user
+            else AdminUser.query.order_by(AdminUser.id).first()
+        )
+        if not uploader:
+            print("No admin user found. Run init-db.py first or pass --user.")
+            return
+
+        if args.dir:
+            entries = iter_directory(args.dir, args.category, args.period, args.tags)
+        else:
+            entries = iter_manifest(args.manifest, args.category, args.period, args.tags)
+
+        done = load_checkpoint(args.checkpoint)
+        if done:
+            print(f"Resuming: {len(done)} files already imported.")
+
+        isolated = app.config["EXTRACTION_ISOLATED"]
+        lookups = Lookups()
+        seen_blobs = {}
+        imported = 0
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            batch = []
+            for entry in entries:
+                if entry["path"] in done:
+                    continue
+                batch.append(entry)
+                if len(batch) < args.batch_size:
+                    continue
+                committed = import_batch(
+                    app, executor, batch, lookups, uploader, seen_blobs, isolated
+                )
+                append_checkpoint(args.checkpoint, committed)
+                imported += len(committed)
+                batch = []
+                rate = imported / max(time.monotonic() - started, 1e-6)
+                print(f"Imported {imported} documents ({rate:.1f}/s)...")
+
+            if batch:
+                committed = import_batch(
+                    app, executor, batch, lookups, uploader, seen_blobs, isolated
+                )
+                append_checkpoint(args.checkpoint, committed)
+                imported += len(committed)
+
+        print(f"Import complete: {imported} documents.")
+
+
+if __name__ == "__main__":
+    bulk_import(parse_args())
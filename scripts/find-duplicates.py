@@ -0,0 +1,40 @@
+import argparse
+from app import create_app
+from app.extensions import db
+from app.models import Document
+from app.documents.duplicates import sign_missing_documents, sweep_duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweep the archive for near-duplicate documents."
+    )
+    parser.add_argument(
+        "--threshold", type=float, help="Minimum similarity (default DUPLICATE_THRESHOLD)."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=500, help="Documents signed per transaction."
+    )
+    args = parser.parse_args()
+
+    app = create_app("default")
+    with app.app_context():
+        signed = sign_missing_documents(batch_size=args.batch_size)
+        print(f"Signed {signed} document(s) without a signature.")
+
+        pairs = sweep_duplicates(threshold=args.threshold)
+        titles = dict(
+            db.session.query(Document.id, Document.title).filter(
+                Document.id.in_({doc_id for pair in pairs for doc_id in pair[:2]})
+            )
+        )
+        for first, second, score in pairs:
+            print(
+                f"{score:.0%}  #{first} {titles.get(first)!r}  ~  "
+                f"#{second} {titles.get(second)!r}"
+            )
+        print(f"Found {len(pairs)} near-duplicate pair(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,49 @@
+from sqlalchemy import inspect, literal, text
 from app.extensions import db
 from app.models import AcademicPeriod, Category, Tag, AdminUser
+from app.search.backends import install_fulltext
+
+
+def upgrade_schema():
+    """
+    Adds the columns and indexes that create_all() leaves out of tables that
+    already exist, so a database created by an older version keeps working.
+    Columns are added nullable with their scalar default, which fills in the
+    existing rows. Safe to run again.
+    """
+    dialect = db.engine.dialect
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (
+                f"ALTER TABLE {dialect.identifier_preparer.quote(table.name)} "
+                f"ADD COLUMN {dialect.identifier_preparer.quote(column.name)} "
+                f"{column.type.compile(dialect=dialect)}"
+            )
+            if column.default is not None and column.default.is_scalar:
+                value = literal(column.default.arg, column.type).compile(
+                    dialect=dialect, compile_kwargs={"literal_binds": True}
+                )
+                ddl += f" DEFAULT {value}"
+            db.session.execute(text(ddl))
+            print(f"Added column {table.name}.{column.name}")
+        db.session.commit()
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
 
 
 def init_db(app):
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+        # DDL that can rewrite the document table on PostgreSQL, so it runs
+        # here rather than on every app start
+        install_fulltext()
 
         if AdminUser.query.count() == 0:
             admin = AdminUser(
@@ -1,30 +1,234 @@
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from meilisearch_python_sdk.models.settings import Pagination
+
 from app import create_app
-from app.models import Document
-from app.search.services import index_document, get_meili_index
+from app.extensions import db
+from app.models import Document, SearchOutbox
+from app.search.outbox import queue_index_sync_ids
+from app.search.services import INDEX_SETTINGS, document_to_index, get_meili_client
+from app.search.cache import bump_index_version
+
+TASK_TIMEOUT_MS = 30 * 60 * 1000
+
+
+def _eager(query):
+    return query.options(
+        joinedload(Document.category),
+        joinedload(Document.correspondent),
+        joinedload(Document.academic_period),
+        selectinload(Document.tags),
+    )
+
+
+def iter_document_batches(batch_size, query=None):
+    """
+    Streams documents in id order using keyset pagination, with category,
+    period and tags loaded up front so building payloads issues no extra queries.
+    """
+    query = query if query is not None else Document.query.filter(Document.is_deleted == False)
+    last_id = 0
+    while True:
+        batch = (
+            _eager(query.filter(Document.id > last_id))
+            .order_by(Document.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            return
+        last_id = batch[-1].id
+        yield batch
+
+
+def send_batches(index, batches, concurrency, total=None):
+    """
+    Sends payload batches with at most `concurrency` requests in flight.
+    Returns (documents sent, documents in failed requests, task uids).
+    """
+    sent = 0
+    failed = 0
+    task_uids = []
+    started = time.monotonic()
+
+    def finish(future, count):
+        try:
+            task_uids.append(future.result().task_uid)
+            return 0
+        except Exception as e:
+            print(f"Failed to send batch of {count} documents: {e}")
+            return count
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+        for batch in batches:
+            payloads = [document_to_index(doc) for doc in batch]
+            # Drop the ORM objects (and their content_text) before the next page
+            db.session.expunge_all()
+
+            while len(pending) >= concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    failed += finish(future, pending.pop(future))
+
+            pending[executor.submit(index.add_documents, payloads)] = len(payloads)
+            sent += len(payloads)
+
+            if total:
+                rate = sent / max(time.monotonic() - started, 1e-6)
+                print(f"Queued {sent}/{total} documents ({rate:.0f} docs/s)...")
+
+        for future in list(pending):
+            failed += finish(future, pending.pop(future))
+
+    return sent, failed, task_uids
+
 
+def wait_for_tasks(client, task_uids):
+    for task_uid in task_uids:
+        result = client.wait_for_task(task_uid, timeout_in_ms=TASK_TIMEOUT_MS)
+        if result.status != "succeeded":
+            raise RuntimeError(f"Meilisearch task {task_uid} {result.status}: {result.error}")
 
-def reindex_all():
+
+def outbox_watermark():
+    return db.session.query(func.max(SearchOutbox.id)).scalar() or 0
+
+
+def changed_since(watermark):
+    """
+    Ids of documents with an outbox entry after the watermark. Every change
+    that affects the index writes one, including tag, category and
+    correspondent renames and purges, which leave updated_at alone.
+    """
+    return {
+        doc_id
+        for (doc_id,) in db.session.query(SearchOutbox.document_id)
+        .filter(SearchOutbox.id > watermark)
+        .distinct()
+    }
+
+
+def replay_changes(client, index, document_ids, batch_size, concurrency):
+    """
+    Sends the current state of the given documents to the index: live ones
+    are upserted, trashed and purged ones deleted.
+    """
+    if not document_ids:
+        return 0
+    changed = Document.query.filter(
+        Document.is_deleted == False, Document.id.in_(document_ids)
+    )
+    _, failed, task_uids = send_batches(
+        index, iter_document_batches(batch_size, changed), concurrency
+    )
+
+    live_ids = {
+        doc_id
+        for (doc_id,) in db.session.query(Document.id).filter(
+            Document.is_deleted == False, Document.id.in_(document_ids)
+        )
+    }
+    deleted_ids = [str(doc_id) for doc_id in document_ids - live_ids]
+    if deleted_ids:
+        task_uids.append(index.delete_documents(deleted_ids).task_uid)
+
+    wait_for_tasks(client, task_uids)
+    return failed
+
+
+def reindex_all(batch_size=2000, concurrency=4):
+    """
+    Rebuilds the index into a shadow copy and swaps it in atomically, so search
+    keeps serving the old index for the whole rebuild.
+    """
     app = create_app("default")
     with app.app_context():
-        # Clear existing index
+        client = get_meili_client()
+        live_name = current_app.config["MEILI_INDEX_NAME"]
+        shadow_name = f"{live_name}_rebuild_{datetime.utcnow():%Y%m%d%H%M%S}"
+
+        live = client.get_or_create_index(live_name, primary_key="id")
+        # Keep anything tuned on the live index, but the managed settings come from code
+        settings = live.get_settings()
+        for field, value in INDEX_SETTINGS.items():
+            setattr(settings, field, value)
+        settings.pagination = Pagination(
+            max_total_hits=current_app.config["SEARCH_MAX_TOTAL_HITS"]
+        )
+        shadow = client.create_index(
+            shadow_name,
+            primary_key="id",
+            settings=settings,
+            timeout_in_ms=TASK_TIMEOUT_MS,
+        )
+        print(f"Building shadow index '{shadow_name}'.")
+
         try:
-            index = get_meili_index()
-            index.delete_all_documents()
-            print("Cleared existing index.")
-        except Exception as e:
-            print(f"Could not clear index: {e}")
+            watermark = outbox_watermark()
+            total = Document.query.filter_by(is_deleted=False).count()
+            print(f"Reindexing {total} documents...")
+
+            started = time.monotonic()
+            sent, failed, task_uids = send_batches(
+                shadow, iter_document_batches(batch_size), concurrency, total
+            )
+            if failed:
+                raise RuntimeError(f"{failed} documents could not be sent")
+            wait_for_tasks(client, task_uids)
+            print(f"Indexed {sent} documents in {time.monotonic() - started:.1f}s.")
 
-        documents = Document.query.filter_by(is_deleted=False).all()
-        total = len(documents)
-        print(f"Reindexing {total} documents...")
+            # Catch up with writes that happened while the bulk load ran
+            replay_watermark = outbox_watermark()
+            changed = changed_since(watermark)
+            if replay_changes(client, shadow, changed, batch_size, concurrency):
+                raise RuntimeError("Replaying changes failed")
 
-        for i, doc in enumerate(documents):
-            index_document(doc)
-            if (i + 1) % 10 == 0:
-                print(f"Indexed {i + 1}/{total}...")
+            expected = Document.query.filter_by(is_deleted=False).count()
+            indexed = shadow.get_stats().number_of_documents
+            if indexed != expected:
+                raise RuntimeError(
+                    f"Shadow index holds {indexed} documents, database has {expected}"
+                )
 
+            wait_for_tasks(client, [client.swap_indexes([(live_name, shadow_name)]).task_uid])
+            bump_index_version()
+            print(f"Swapped '{shadow_name}' into '{live_name}'.")
+        except Exception as e:
+            client.delete_index_if_exists(shadow_name)
+            print(f"Reindex aborted, live index left untouched: {e}")
+            return False
+
+        # Writes between the replay and the swap went to the old index. The
+        # swap is done, so a failure here must not abort: hand the documents
+        # back to the worker instead
+        changed = set()
+        try:
+            changed = changed_since(replay_watermark)
+            if replay_changes(client, live, changed, batch_size, concurrency):
+                raise RuntimeError("some batches could not be sent")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Replaying {len(changed)} late changes failed ({e}); queued for the worker.")
+            try:
+                queue_index_sync_ids(changed)
+                db.session.commit()
+            except Exception as e:
+                print(f"Could not queue them either ({e}); run the worker's sync or reindex again.")
+        bump_index_version()
+        client.delete_index_if_exists(shadow_name)
         print("Reindexing complete!")
+        return True
 
 
 if __name__ == "__main__":
-    reindex_all()
+    parser = argparse.ArgumentParser(description="Rebuild the Meilisearch index.")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    reindex_all(batch_size=args.batch_size, concurrency=args.concurrency)
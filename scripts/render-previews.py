@@ -0,0 +1,47 @@
+import argparse
+from app import create_app
+from app.extensions import db
+from app.models import Document
+from app.documents.jobs import enqueue_preview
+from app.documents.previews import get_preview_file, preview_failed, supports_preview
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Queue preview rendering for documents that have no previews yet."
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=500, help="Documents per transaction."
+    )
+    args = parser.parse_args()
+
+    app = create_app("default")
+    with app.app_context():
+        queued = 0
+        last_id = 0
+        while True:
+            batch = (
+                Document.query.filter(Document.is_deleted == False, Document.id > last_id)
+                .order_by(Document.id)
+                .limit(args.batch_size)
+                .all()
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for doc in batch:
+                if not supports_preview(doc.mime_type) or preview_failed(doc):
+                    continue
+                if all(
+                    get_preview_file(doc, size)
+                    for size in app.config["PREVIEW_SIZES"]
+                ):
+                    continue
+                if enqueue_preview(doc):
+                    queued += 1
+            db.session.commit()
+        print(f"Queued {queued} document(s) for preview rendering; the worker renders them.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import argparse
+from app import create_app
+from app.documents.jobs import run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the document ingest worker.")
+    parser.add_argument(
+        "--once", action="store_true", help="Drain the queue once and exit."
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, help="Seconds to sleep when the queue is empty."
+    )
+    args = parser.parse_args()
+
+    app = create_app("default")
+    with app.app_context():
+        processed = run_worker(poll_interval=args.poll_interval, once=args.once)
+        if args.once:
+            print(f"Processed {processed} job(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import pytest
+from app import create_app
+from app.extensions import db as _db
+from app.models import AcademicPeriod, AdminUser, Category, Document
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app("testing")
+    app.config["UPLOAD_FOLDER"] = str(tmp_path)
+    with app.app_context():
+        _db.create_all()
+        yield app
+        _db.session.remove()
+        _db.drop_all()
+
+
+@pytest.fixture
+def db(app):
+    return _db
+
+
+@pytest.fixture
+def make_document(db):
+    category = Category(name="Finance", slug="finance")
+    period = AcademicPeriod(year_start=2024, year_end=2025, semester="Fall")
+    db.session.add_all([category, period])
+    db.session.commit()
+
+    def make_document(title="Document", **fields):
+        document = Document(
+            title=title,
+            original_filename=f"{title}.txt",
+            stored_filename=f"{title}.txt",
+            file_path=f"/nonexistent/{title}.txt",
+            mime_type="text/plain",
+            category_id=category.id,
+            academic_period_id=period.id,
+            **fields,
+        )
+        db.session.add(document)
+        db.session.commit()
+        return document
+
+    return make_document
+
+
+@pytest.fixture
+def client(app, db):
+    user = AdminUser(username="admin")
+    user.set_password("secret")
+    db.session.add(user)
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+    return client
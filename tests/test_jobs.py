@@ -0,0 +1,194 @@
+from datetime import datetime, timedelta
+import pytest
+from app.documents import jobs
+from app.documents.jobs import (
+    INGEST_STAGES,
+    claim_next_job,
+    enqueue_ingest,
+    run_job,
+)
+from app.models import IngestJob
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """
+    Replaces every stage handler with a recorder; set `fail[stage]` to make
+    that stage raise.
+    """
+    calls = []
+    fail = {}
+
+    def handler(stage):
+        def run(document):
+            calls.append(stage)
+            if stage in fail:
+                raise fail[stage]
+
+        return run
+
+    monkeypatch.setattr(
+        jobs, "STAGE_HANDLERS", {stage: handler(stage) for stage in INGEST_STAGES}
+    )
+    return calls, fail
+
+
+def queued_job(db, document, **fields):
+    job = enqueue_ingest(document)
+    for name, value in fields.items():
+        setattr(job, name, value)
+    db.session.commit()
+    return job
+
+
+def test_enqueue_marks_document_processing(db, make_document):
+    document = make_document(processing_error="extract: old")
+    job = queued_job(db, document)
+
+    assert document.status == "processing"
+    assert document.processing_error is None
+    assert (job.stage, job.status, job.attempts) == ("extract", "queued", 0)
+
+
+def test_claim_locks_oldest_runnable_job(app, db, make_document):
+    now = datetime.utcnow()
+    later = queued_job(db, make_document("later"), run_after=now - timedelta(seconds=5))
+    first = queued_job(db, make_document("first"), run_after=now - timedelta(seconds=10))
+    queued_job(db, make_document("future"), run_after=now + timedelta(hours=1))
+
+    claimed = claim_next_job("test-worker")
+    assert claimed.id == first.id
+    assert (claimed.status, claimed.locked_by, claimed.attempts) == (
+        "running",
+        "test-worker",
+        1,
+    )
+
+    assert claim_next_job("test-worker").id == later.id
+    assert claim_next_job("test-worker") is None
+
+
+def test_claim_reclaims_stale_running_job(app, db, make_document):
+    timeout = app.config["INGEST_JOB_TIMEOUT"]
+    stale = queued_job(
+        db,
+        make_document(),
+        status="running",
+        attempts=1,
+        locked_by="dead-worker",
+        locked_at=datetime.utcnow() - timedelta(seconds=timeout + 60),
+    )
+    queued_job(
+        db,
+        make_document("busy"),
+        status="running",
+        attempts=1,
+        locked_by="live-worker",
+        locked_at=datetime.utcnow(),
+    )
+
+    claimed = claim_next_job("test-worker")
+    assert claimed.id == stale.id
+    assert (claimed.locked_by, claimed.attempts) == ("test-worker", 2)
+    assert claim_next_job("test-worker") is None
+
+
+def test_run_job_completes_every_stage(db, make_document, stages):
+    calls, _ = stages
+    document = make_document()
+    queued_job(db, document)
+
+    assert run_job(claim_next_job())
+
+    job = IngestJob.query.one()
+    assert calls == INGEST_STAGES
+    assert (job.status, job.stage) == ("done", INGEST_STAGES[-1])
+    assert job.finished_at is not None
+    assert document.status == "ready"
+
+
+def test_run_job_starts_at_given_stage(db, make_document, stages):
+    calls, _ = stages
+    document = make_document()
+    enqueue_ingest(document, stage="match")
+    db.session.commit()
+
+    assert run_job(claim_next_job())
+    assert calls == INGEST_STAGES[1:]
+
+
+def test_stage_error_on_document_fails_it_without_retry(db, make_document, stages):
+    calls, _ = stages
+    document = make_document()
+    queued_job(db, document)
+
+    def poison(doc):
+        calls.append("extract")
+        doc.processing_error = "extract: unreadable"
+
+    jobs.STAGE_HANDLERS["extract"] = poison
+    assert run_job(claim_next_job())
+
+    job = IngestJob.query.one()
+    assert calls == INGEST_STAGES
+    assert (job.status, job.last_error) == ("done", "extract: unreadable")
+    assert document.status == "failed"
+
+
+def test_failure_requeues_with_backoff_and_resumes(app, db, make_document, stages):
+    calls, fail = stages
+    document = make_document()
+    queued_job(db, document, max_attempts=3)
+    fail["dedup"] = RuntimeError("database busy")
+
+    before = datetime.utcnow()
+    assert not run_job(claim_next_job())
+
+    job = IngestJob.query.one()
+    assert (job.status, job.stage, job.last_error) == ("queued", "dedup", "database busy")
+    assert job.locked_by is None
+    backoff = app.config["INGEST_RETRY_BACKOFF"]
+    assert job.run_after >= before + timedelta(seconds=backoff)
+    assert document.status == "processing"
+
+    # Not runnable until the backoff has passed
+    assert claim_next_job() is None
+    job.run_after = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    del fail["dedup"]
+    calls.clear()
+    assert run_job(claim_next_job())
+    assert calls == INGEST_STAGES[INGEST_STAGES.index("dedup") :]
+    assert document.status == "ready"
+
+
+def test_backoff_doubles_per_attempt(app, db, make_document, stages):
+    _, fail = stages
+    queued_job(db, make_document(), attempts=2, max_attempts=5)
+    fail["extract"] = RuntimeError("flaky")
+
+    before = datetime.utcnow()
+    run_job(claim_next_job())
+
+    job = IngestJob.query.one()
+    backoff = app.config["INGEST_RETRY_BACKOFF"] * 2 ** (job.attempts - 1)
+    assert job.attempts == 3
+    assert before + timedelta(seconds=backoff) <= job.run_after
+    assert job.run_after < before + timedelta(seconds=backoff * 2)
+
+
+def test_failure_on_last_attempt_fails_job_and_document(db, make_document, stages):
+    _, fail = stages
+    document = make_document()
+    queued_job(db, document, attempts=2, max_attempts=3)
+    fail["related"] = RuntimeError("gave up")
+
+    assert not run_job(claim_next_job())
+
+    job = IngestJob.query.one()
+    assert (job.status, job.attempts) == ("failed", 3)
+    assert job.finished_at is not None
+    assert document.status == "failed"
+    assert document.processing_error == "related: gave up"
+    assert claim_next_job() is None
@@ -0,0 +1,113 @@
+import base64
+from datetime import datetime, timedelta
+import pytest
+from app.api.pagination import (
+    CursorError,
+    decode_cursor,
+    document_cursor,
+    encode_cursor,
+    keyset_page,
+    newest_first,
+)
+from app.models import Document
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    values = {"u": "2025-01-02T03:04:05", "i": 42}
+    cursor = encode_cursor(values)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == values
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "!!not-base64!!",
+        raw_cursor(b"not json"),
+        raw_cursor(b"[1, 2]"),
+        raw_cursor(b'"text"'),
+        raw_cursor(b"\xff\xfe"),
+    ],
+)
+def test_decode_rejects_malformed_cursors(cursor):
+    with pytest.raises(CursorError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        {"i": 1},
+        {"u": None},
+        {"u": "yesterday", "i": 1},
+        {"u": None, "i": "one"},
+        {"u": 5, "i": 1},
+    ],
+)
+def test_newest_first_rejects_bad_cursor_values(app, values):
+    with pytest.raises(CursorError):
+        newest_first(Document.query, encode_cursor(values))
+
+
+def test_keyset_pages_cover_every_document_once(db, make_document):
+    start = datetime(2025, 1, 1)
+    expected = []
+    for n in range(7):
+        # Pairs share a timestamp, so ties are broken by id
+        doc = make_document(f"doc{n}", uploaded_at=start + timedelta(days=n // 2))
+        expected.append(doc.id)
+    for n in range(2):
+        doc = make_document(f"undated{n}")
+        doc.uploaded_at = None
+        db.session.commit()
+        expected.append(doc.id)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = keyset_page(Document.query, cursor, 3)
+        seen.extend(doc.id for doc in page)
+        if cursor is None:
+            break
+
+    assert sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen))
+    assert seen == [doc.id for doc in newest_first(Document.query)]
+
+
+def test_document_cursor_resumes_after_document(db, make_document):
+    older = make_document("older", uploaded_at=datetime(2025, 1, 1))
+    newer = make_document("newer", uploaded_at=datetime(2025, 2, 1))
+
+    assert newest_first(Document.query, document_cursor(newer)).all() == [older]
+    assert newest_first(Document.query, document_cursor(older)).all() == []
+
+
+def test_api_rejects_invalid_cursor(client, make_document):
+    make_document()
+
+    response = client.get("/api/documents?cursor=garbage")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cursor"}
+
+    response = client.get(f"/api/documents?cursor={encode_cursor({'u': 'x', 'i': 1})}")
+    assert response.status_code == 400
+
+
+def test_api_follows_next_cursor(client, make_document):
+    ids = [make_document(f"doc{n}").id for n in range(5)]
+
+    seen = []
+    url = "/api/documents?per_page=2"
+    while url:
+        body = client.get(url).get_json()
+        seen.extend(doc["id"] for doc in body["documents"])
+        cursor = body["pagination"]["next_cursor"]
+        url = f"/api/documents?per_page=2&cursor={cursor}" if cursor else None
+
+    assert sorted(seen) == sorted(ids)